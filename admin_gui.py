@@ -7,6 +7,9 @@ import cv2
 import numpy as np
 from image_utils import ImgUtils
 
+REPLAY_SECONDS = 10.0
+REPLAY_SPEED = 0.5
+
 class PIDGraph:
     """Generates a PID graph image with a 640x380 aspect ratio."""
     GRAPH_WIDTH = 640  # Updated to match the desired aspect ratio
@@ -74,6 +77,7 @@ class AdminGUI(tk.Tk):
         ttk.Button(btn_frame, text="Stop", command=self.stop).pack(side=tk.LEFT, padx=5)
         ttk.Button(btn_frame, text="Continue", command=self.continue_).pack(side=tk.LEFT, padx=5)
         ttk.Button(btn_frame, text="Reset PID", command=self.reset).pack(side=tk.LEFT, padx=5)
+        ttk.Button(btn_frame, text=f"Replay {REPLAY_SECONDS:.0f} s", command=self.replay).pack(side=tk.LEFT, padx=5)
         
         # Middle frame for the four images
         mid_frame = ttk.Frame(self)
@@ -113,29 +117,16 @@ class AdminGUI(tk.Tk):
         label_height = self.orig_lbl.winfo_height()
         
         if label_width > 1 and label_height > 1:
-            orig_resized = self.resize_with_aspect_ratio(orig_img, label_width, label_height)
-            mask_resized = self.resize_with_aspect_ratio(mask_img, label_width, label_height)
-            warped_resized = self.resize_with_aspect_ratio(warped_img, label_width, label_height)
-            pid_resized = self.resize_with_aspect_ratio(pid_img, label_width, label_height)
-            
-            orig_resized = cv2.cvtColor(orig_resized, cv2.COLOR_BGR2RGB)
-            mask_resized = cv2.cvtColor(mask_resized, cv2.COLOR_BGR2RGB)
-            warped_resized = cv2.cvtColor(warped_resized, cv2.COLOR_BGR2RGB)
-            pid_resized = cv2.cvtColor(pid_resized, cv2.COLOR_BGR2RGB)
-            
-            self.orig_photo = ImageTk.PhotoImage(image=Image.fromarray(orig_resized))
-            self.mask_photo = ImageTk.PhotoImage(image=Image.fromarray(mask_resized))
-            self.warped_photo = ImageTk.PhotoImage(image=Image.fromarray(warped_resized))
-            self.pid_photo = ImageTk.PhotoImage(image=Image.fromarray(pid_resized))
-            
-            self.orig_lbl.config(image=self.orig_photo)
-            self.orig_lbl.image = self.orig_photo  # keep reference to avoid flickering
-            self.mask_lbl.config(image=self.mask_photo)
-            self.mask_lbl.image = self.mask_photo
-            self.warped_lbl.config(image=self.warped_photo)
-            self.warped_lbl.image = self.warped_photo
-            self.pid_lbl.config(image=self.pid_photo)
-            self.pid_lbl.image = self.pid_photo
+            # Panels may be None (processing error, replay); those keep their last image
+            for img, lbl in ((orig_img, self.orig_lbl), (mask_img, self.mask_lbl),
+                             (warped_img, self.warped_lbl), (pid_img, self.pid_lbl)):
+                if img is None:
+                    continue
+                resized = self.resize_with_aspect_ratio(img, label_width, label_height)
+                resized = cv2.cvtColor(resized, cv2.COLOR_BGR2RGB)
+                photo = ImageTk.PhotoImage(image=Image.fromarray(resized))
+                lbl.config(image=photo)
+                lbl.image = photo  # keep reference to avoid flickering
         
         self.info.set(info_str)
     
@@ -152,6 +143,11 @@ class AdminGUI(tk.Tk):
         if self.server:
             self.server.pid.reset()
     
+    def replay(self):
+        """Ask the car to replay the last few seconds; the car is not driven meanwhile."""
+        if self.server:
+            self.server.request_replay(REPLAY_SECONDS, REPLAY_SPEED)
+
     def set_car_ip(self, ip):
         """Update the displayed car IP address."""
         self.car_ip.set(f"Car IP: {ip}")
\ No newline at end of file
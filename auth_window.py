@@ -9,6 +9,7 @@ class AuthWindow(tk.Tk):
         self.client = client
         self.authenticated = False
         self.role = None
+        self.control_port = None  # UDP control port offered to the admin, if any
         self._build_initial_widgets()
 
     def _build_initial_widgets(self):
@@ -92,6 +93,7 @@ class AuthWindow(tk.Tk):
             self.authenticated = True
             if username == "admin" and password == "admin":
                 self.role = "ADMIN"
+                self.control_port = response.get("control_port")
             else:
                 self.role = "SPECTATOR"
             self.destroy()
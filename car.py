@@ -1,8 +1,13 @@
 # Contains the MotorController class for controlling a robot car's motors.
 
-import RPi.GPIO as GPIO
 import time
 import threading
+from fake_hw import fake_hw_enabled
+
+if fake_hw_enabled():
+    from fake_hw import GPIO
+else:
+    import RPi.GPIO as GPIO
 
 class MotorController:
     """
@@ -52,10 +57,12 @@ class MotorController:
         self.in4 = in4
         self.enb = enb   # Left motor PWM pin
         self.default_frequency = default_frequency
+        self.direction = 'unknown'  # 'forward', 'backward' or None when stopped
 
         GPIO.setmode(GPIO.BCM)
         for pin in (self.ena, self.in1, self.in2, self.in3, self.in4, self.enb):
             GPIO.setup(pin, GPIO.OUT)
+        self._set_direction(None)  # drive direction pins to a known state
 
         self.ena_pwm = self.SoftwarePWM(self.ena, frequency=self.default_frequency, duty_cycle=0)
         self.enb_pwm = self.SoftwarePWM(self.enb, frequency=self.default_frequency, duty_cycle=0)
@@ -71,22 +78,10 @@ class MotorController:
             left_freq = self.default_frequency
         if right_freq is None:
             right_freq = self.default_frequency
-        
 
         # Set the direction for forward motion.
-        GPIO.output(self.in1, GPIO.HIGH)
-        GPIO.output(self.in2, GPIO.LOW)
-        GPIO.output(self.in3, GPIO.LOW)
-        GPIO.output(self.in4, GPIO.HIGH)
-
-        # Convert duty cycle fractions to percentages.
-        left_percent = left_duty * 100
-        right_percent = right_duty * 100
-
-        self.ena_pwm.change_duty_cycle(right_percent)  # Right motor PWM (typically the stronger motor)
-        self.enb_pwm.change_duty_cycle(left_percent)   # Left motor PWM
-        self.ena_pwm.change_frequency(right_freq)      # Right motor frequency
-        self.enb_pwm.change_frequency(left_freq)       # Left motor frequency
+        self._set_direction('forward')
+        self._set_pwm(left_duty, right_duty, left_freq, right_freq)
 
 
     def move_backward(self, left_duty, right_duty, left_freq=None, right_freq=None):
@@ -100,11 +95,24 @@ class MotorController:
             right_freq = self.default_frequency
 
         # Set the direction for backward motion (reverse of forward).
-        GPIO.output(self.in1, GPIO.LOW)
-        GPIO.output(self.in2, GPIO.HIGH)
-        GPIO.output(self.in3, GPIO.HIGH)
-        GPIO.output(self.in4, GPIO.LOW)
-
+        self._set_direction('backward')
+        self._set_pwm(left_duty, right_duty, left_freq, right_freq)
+
+    def _set_direction(self, direction):
+        """Write the four direction pins, skipping the writes if nothing changes."""
+        if direction == self.direction:
+            return
+        if direction == 'forward':
+            levels = (GPIO.HIGH, GPIO.LOW, GPIO.LOW, GPIO.HIGH)
+        elif direction == 'backward':
+            levels = (GPIO.LOW, GPIO.HIGH, GPIO.HIGH, GPIO.LOW)
+        else:
+            levels = (GPIO.LOW, GPIO.LOW, GPIO.LOW, GPIO.LOW)
+        for pin, level in zip((self.in1, self.in2, self.in3, self.in4), levels):
+            GPIO.output(pin, level)
+        self.direction = direction
+
+    def _set_pwm(self, left_duty, right_duty, left_freq, right_freq):
         # Convert duty cycle fractions to percentages.
         left_percent = left_duty * 100
         right_percent = right_duty * 100
@@ -117,8 +125,7 @@ class MotorController:
     def stop(self):
         self.ena_pwm.change_duty_cycle(0)
         self.enb_pwm.change_duty_cycle(0)
-        for pin in (self.in1, self.in2, self.in3, self.in4):
-            GPIO.output(pin, GPIO.LOW)
+        self._set_direction(None)
 
     def cleanup(self):
         self.ena_pwm.stop()
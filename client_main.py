@@ -1,22 +1,140 @@
-import threading
 import time
+_T_START = time.perf_counter()  # process start reference for import/startup timing
+
+import argparse
+import collections
+import os
+import queue
+import signal
+import threading
 import numpy as np
 import cv2
 import socket
 from image_utils import ImgUtils
 from pid_controller import PID
-from admin_gui import AdminGUI
-from spec_gui import SpectatorGUI
-from auth_window import AuthWindow
+from lane_tracker import LaneTracker
+from predictor import LatencyPredictor
 from protocol import Protocol
+import tcp_video
+from tcp_video import VideoFrame
+from session_crypto import ReplayError
+from control_channel import ControlSender
+from render_process import RemoteGUI
+from sampler import SamplingProfiler, write_profile
+
+# Estimated one-way network delay in each direction, added to the measured
+# processing time when projecting the lane error forward.
+NETWORK_DELAY = 0.015
+USE_UDP_CONTROL = True  # send PWM over the UDP control channel when the car offers one
+# Run the Tk GUI in its own process, fed through shared memory (or set CAR_GUI_PROCESS=1)
+GUI_PROCESS = os.environ.get("CAR_GUI_PROCESS", "") not in ("", "0")
+# Threshold through ThresholdLUT instead of cvtColor + inRange (or set CAR_THRESHOLD_LUT=1).
+# Off by default: on 480x270 frames the table gather is slower (see python image_utils.py).
+USE_THRESHOLD_LUT = os.environ.get("CAR_THRESHOLD_LUT", "") not in ("", "0")
+LOOP_STATS_INTERVAL = 10.0  # seconds between control-loop rate reports
+PROFILE_RATE = 100  # samples per second for SIGUSR1 (this client) and SIGUSR2 (the car, admin only)
+UDP_TIMEOUT = 3.0  # seconds without a datagram after the car is ready before switching to TCP video
+DEFAULT_HOST = "raspitwo.local"
+DEFAULT_PORT = 8000
+
+IMPORT_SECONDS = time.perf_counter() - _T_START  # Tk modules are imported later, only for the GUI
+
+class LoopStats:
+    """Rate and jitter of the control loop over the most recent iterations."""
+
+    def __init__(self, window=200):
+        self._intervals = collections.deque(maxlen=window)
+        self._last = None
+
+    def tick(self):
+        now = time.perf_counter()
+        if self._last is not None:
+            self._intervals.append(now - self._last)
+        self._last = now
+
+    def summary(self):
+        n = len(self._intervals)
+        if n < 2:
+            return None
+        mean = sum(self._intervals) / n
+        var = sum((x - mean) ** 2 for x in self._intervals) / (n - 1)
+        return {"rate": 1.0 / mean if mean > 0 else 0.0,
+                "jitter_ms": var ** 0.5 * 1000,
+                "max_ms": max(self._intervals) * 1000}
+
+class _TextSink:
+    """Stands in for a Tk StringVar: status text goes to stdout."""
+
+    def set(self, text):
+        print(f"[INFO] {text}")
+
+class _ValueGraph:
+    def update(self, error, pid_output):
+        return None
+
+class HeadlessTelemetry:
+    """
+    GUI stand-in for headless driving. Client.run records one compact line
+    per frame (optionally to a file) and a summary is printed every interval.
+    """
+    is_admin = True
+    wants_visuals = False
+    HEADER = "t,error,measured,pid,left,right,lf,rf,confidence"
+
+    def __init__(self, log_path=None, interval=1.0):
+        self.control_flags = {"stopped": False}
+        self.pid_graph = _ValueGraph()
+        self.info = _TextSink()
+        self.server = None
+        self.interval = interval
+        self._log = open(log_path, "a", buffering=1 << 16) if log_path else None
+        if self._log is not None and self._log.tell() == 0:
+            self._log.write(self.HEADER + "\n")
+        self._frames = 0
+        self._last_print = time.monotonic()
+
+    def set_car_ip(self, ip):
+        print(f"[INFO] Car at {ip}")
+
+    def update_gui(self, orig_img, mask_img, warped_img, pid_img, info_str):
+        if info_str.startswith("Error"):
+            print(f"[WARNING] {info_str}")
+
+    def record(self, t, error, measured, pid_out, left, right, lf, rf, confidence):
+        self._frames += 1
+        if self._log is not None:
+            self._log.write(f"{t:.4f},{error:.4f},{measured:.4f},{pid_out:.5f},"
+                            f"{left:.4f},{right:.4f},{lf},{rf},{confidence:.2f}\n")
+        if t - self._last_print >= self.interval:
+            rate = self._frames / (t - self._last_print)
+            print(f"[DRIVE] {rate:5.1f} fps  err {error:+.3f}  pid {pid_out:+.4f}  "
+                  f"L {left:.3f} R {right:.3f}  lane {confidence:.2f}")
+            self._frames = 0
+            self._last_print = t
+
+    def close(self):
+        if self._log is not None:
+            self._log.close()
 
 class Client(threading.Thread):
     def __init__(self, server_ip, server_port):
         super().__init__(daemon=True)
         self.protocol = Protocol('client', server_ip, server_port)
         self.gui = None
-        self.pid = PID()
+        self.pid = PID(tracker=LaneTracker(), predictor=LatencyPredictor())
         self.running = False
+        self.server_state = None  # last STATUS state from the server
+        self.control = None       # ControlSender when PWM goes over UDP
+        self.loop_stats = LoopStats()
+        self.video_mode = 'udp'
+        self._video_cond = threading.Condition()
+        self._video_latest = None  # newest VideoFrame from the TCP stream
+        self._ready_since = None
+        self._last_datagram = time.monotonic()
+        self.replaying = False  # frames are from the car's history; do not drive on them
+        self.profiler = SamplingProfiler(PROFILE_RATE)
+        self.server_profiling = False
+        self._profile_requests = queue.SimpleQueue()  # filled by signal handlers, see install_profile_signals
         self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.udp_socket.bind(('', 0))
         self.udp_port = self.udp_socket.getsockname()[1]
@@ -34,6 +152,111 @@ class Client(threading.Thread):
                 print("Connection failed. Trying again in 2 seconds...")
                 time.sleep(2)
 
+    def enable_udp_control(self, port):
+        if self.video_mode == 'tcp':
+            return  # already fell back from UDP, keep PWM on TCP too
+        self.control = ControlSender(self.protocol, (self.protocol.host, port))
+        print(f"[INFO] Sending PWM over UDP control port {port}")
+
+    def send_pwm(self, pwm):
+        control = self.control
+        if control is not None:
+            control.send(pwm)
+        else:
+            self.protocol.send_json(pwm)
+
+    def register_udp(self, viewport=None):
+        """Tell the server where to send video; viewport (width, height) selects the stream size."""
+        msg = {"type": self.protocol.CMDS['UDP_PORT'], "port": self.udp_port}
+        if viewport:
+            msg["viewport"] = list(viewport)
+        self.protocol.send_json(msg)
+
+    def send_viewport(self, width, height):
+        self.protocol.send_json({"type": self.protocol.CMDS['VIEWPORT'], "width": width, "height": height})
+
+    def request_replay(self, seconds, speed=1.0):
+        self.protocol.send_json({"type": self.protocol.CMDS['REPLAY'], "seconds": seconds, "speed": speed})
+
+    def handle_replay(self, msg):
+        status = msg.get("status")
+        self.replaying = status == "started"
+        if status == "started":
+            text = f"Replaying the last {msg.get('seconds', 0):.1f} s at {msg.get('speed', 1):g}x"
+        elif status == "done":
+            text = "Replay finished, back to live video"
+        else:
+            text = "Nothing to replay yet"
+        print(f"[INFO] {text}")
+        if self.gui is not None:
+            self.gui.info.set(text)
+
+    def toggle_profile(self):
+        """Start sampling this process, or stop and save the collapsed stacks."""
+        if not self.profiler.running:
+            self.profiler.start()
+            print(f"[PROFILE] Client profiling at {self.profiler.rate} Hz, send the signal again to stop")
+            return
+        collapsed = self.profiler.stop()
+        self.report_profile("client", collapsed, self.profiler.stats())
+
+    def toggle_server_profile(self):
+        """Ask the car to start profiling, or to stop and send its collapsed stacks."""
+        if not getattr(self.gui, 'is_admin', False):
+            print("[PROFILE] Only the admin can profile the car")
+            return
+        action = "stop" if self.server_profiling else "start"
+        self.server_profiling = not self.server_profiling
+        self.protocol.send_json({"type": self.protocol.CMDS['PROFILE'], "action": action, "rate": PROFILE_RATE})
+
+    def run_profile_requests(self):
+        """
+        Carry out toggles queued by the signal handlers. They run on the main
+        thread, which may already hold the protocol's send lock, so they only
+        queue and the toggling and sending happen here.
+        """
+        while True:
+            which = self._profile_requests.get()
+            try:
+                if which == "client":
+                    self.toggle_profile()
+                else:
+                    self.toggle_server_profile()
+            except Exception as e:
+                print(f"[PROFILE] {which} profile toggle failed: {e}")
+
+    def handle_profile(self, msg):
+        status = msg.get("status")
+        if status == "started":
+            print(f"[PROFILE] Car profiling at {msg.get('rate')} Hz, send the signal again to stop")
+        elif status == "stopped":
+            self.report_profile("server", msg.get("collapsed", ""), msg.get("stats", {}))
+        elif status == "rejected":
+            self.server_profiling = False
+            print(f"[PROFILE] The car refused to profile: {msg.get('message')}")
+        else:
+            self.server_profiling = False
+            print("[PROFILE] The car was not profiling")
+
+    def report_profile(self, which, collapsed, stats):
+        path = write_profile(collapsed, which)
+        print(f"[PROFILE] {which}: {stats.get('samples', 0)} samples at {stats.get('rate', 0):.0f} Hz, "
+              f"{stats.get('sample_ms', 0):.3f} ms per sample, {stats.get('overhead', 0):.2%} of a core; "
+              f"collapsed stacks in {path}")
+
+    def use_tcp_video(self, reason):
+        """Ask the server to stream video on the TCP connection instead of UDP."""
+        if self.video_mode == 'tcp':
+            return
+        self.video_mode = 'tcp'
+        control, self.control = self.control, None
+        if control is not None:
+            # UDP is likely blocked both ways; commands sent there would never reach the car
+            control.close()
+            print("[INFO] Sending PWM over TCP")
+        self.protocol.send_json({"type": self.protocol.CMDS['VIDEO_MODE'], "mode": "tcp"})
+        print(f"[INFO] Switching to TCP video: {reason}")
+
     def send_message(self, msg):
         self.protocol.send_json(msg)
 
@@ -43,22 +266,79 @@ class Client(threading.Thread):
     def handle_messages(self):
         while self.running:
             try:
-                msg = self.protocol.recv_json()
+                msg = self.protocol.recv_message()
             except:
                 break
+            if isinstance(msg, VideoFrame):
+                with self._video_cond:
+                    self._video_latest = msg  # latest frame wins
+                    self._video_cond.notify()
+            elif msg.get("type") == self.protocol.CMDS['STATUS']:
+                self.handle_status(msg.get("state"))
+            elif msg.get("type") == self.protocol.CMDS['REPLAY']:
+                self.handle_replay(msg)
+            elif msg.get("type") == self.protocol.CMDS['PROFILE']:
+                self.handle_profile(msg)
+
+    def handle_status(self, state):
+        self.server_state = state
+        if state == "ready" and self._ready_since is None:
+            self._ready_since = time.monotonic()
+        print(f"[INFO] Car is {state.replace('_', ' ')}")
+        if state == "warming_up" and self.gui is not None:
+            self.gui.info.set("Car is warming up, video will start shortly...")
+
+    def next_frame(self):
+        """
+        Wait briefly for the next frame over the current video transport.
+        Returns (frame, recorded): frame is None if nothing arrived (or only
+        a keep-alive), recorded is True for frames resent from the car's
+        history. Switches to TCP video if UDP stays silent after the car
+        reported ready.
+        """
+        if self.video_mode == 'tcp':
+            with self._video_cond:
+                if self._video_latest is None:
+                    self._video_cond.wait(0.2)
+                msg, self._video_latest = self._video_latest, None
+            if msg is None:
+                return None, False
+            return tcp_video.decode(msg), msg.recorded
+        try:
+            jpeg, recorded = self.protocol.recv_video_udp(self.udp_socket)
+        except socket.timeout:
+            now = time.monotonic()
+            if self._ready_since is not None and now - max(self._ready_since, self._last_datagram) > UDP_TIMEOUT:
+                self.use_tcp_video(f"no UDP datagrams for {UDP_TIMEOUT:.0f} s")
+            return None, False
+        self._last_datagram = time.monotonic()
+        if not jpeg:
+            return None, False
+        return self.protocol.decode_jpeg(jpeg), recorded
 
     def run(self):
         self.running = True
+        self._last_datagram = time.monotonic()
         threading.Thread(target=self.handle_messages, daemon=True).start()
         frame_count = 0
+        last_report = time.monotonic()
         while self.running:
             try:
-                # Receive frame using Protocol method
-                frame = self.protocol.recv_frame_udp(self.udp_socket)
+                frame, recorded = self.next_frame()
+                if frame is None:
+                    continue  # timeout, or a keep-alive: the scene has not changed
+                t_frame = time.monotonic()
                 frame_count += 1
+                self.loop_stats.tick()
+                if t_frame - last_report >= LOOP_STATS_INTERVAL:
+                    last_report = t_frame
+                    self.report_loop_stats()
 
                 # If admin, process; else show only frame
-                if getattr(self.gui, 'is_admin', False):
+                if recorded or self.replaying:
+                    # Never steer on a frame that is not provably live
+                    self.gui.update_gui(frame, None, None, None, "Replay")
+                elif getattr(self.gui, 'is_admin', False):
                     try:
                         mask = ImgUtils.threshold(frame)
                         if mask is None or mask.size == 0:
@@ -71,7 +351,7 @@ class Client(threading.Thread):
                         (error, pid_out,
                          left, right,
                          lf, rf,
-                         derivative, integral, prev_error) = self.pid.process(warped)
+                         derivative, integral, prev_error) = self.pid.process(warped, t_frame)
 
                         # Stopped flag
                         if self.gui.control_flags.get("stopped", False):
@@ -86,17 +366,28 @@ class Client(threading.Thread):
                             "left_freq": lf,
                             "right_freq": rf
                         }
-                        self.protocol.send_json(pwm)
+                        self.send_pwm(pwm)
+                        self.pid.predictor.observe_latency(
+                            time.monotonic() - t_frame + 2 * NETWORK_DELAY)
+
+                        if not getattr(self.gui, 'wants_visuals', True):
+                            self.gui.record(t_frame, error, self.pid.measured_error, pid_out,
+                                            left, right, lf, rf, self.pid.lane_confidence)
+                            continue
 
                         # Build visuals
-                        mask_bgr = cv2.cvtColor(mask, cv2.COLOR_GRAY2BGR)
-                        warped_bgr = cv2.cvtColor(warped, cv2.COLOR_GRAY2BGR)
+                        if getattr(self.gui, 'wants_raw_masks', False):
+                            mask_bgr, warped_bgr = mask, warped
+                        else:
+                            mask_bgr = cv2.cvtColor(mask, cv2.COLOR_GRAY2BGR)
+                            warped_bgr = cv2.cvtColor(warped, cv2.COLOR_GRAY2BGR)
                         pid_img = self.gui.pid_graph.update(error, pid_out)
 
                         info = (
                             f"Err: {error:.2f} | PID: {pid_out:.4f}\n"
                             f"I: {integral:.4f}  D: {derivative:.4f}\n"
-                            f"Ld:{left:.3f}  Rd:{right:.3f} | Lf:{lf}  Rf:{rf}"
+                            f"Ld:{left:.3f}  Rd:{right:.3f} | Lf:{lf}  Rf:{rf}\n"
+                            f"Lane confidence: {self.pid.lane_confidence:.2f}"
                         )
 
                         self.gui.update_gui(frame, mask_bgr, warped_bgr, pid_img, info)
@@ -110,6 +401,9 @@ class Client(threading.Thread):
 
             except socket.timeout:
                 continue
+            except ReplayError:
+                # Reordered or duplicated datagram; a newer frame was already shown
+                continue
             except Exception as e:
                 print(f"[ERROR] Client exception at frame {frame_count}: {e}")
                 break
@@ -117,9 +411,21 @@ class Client(threading.Thread):
         self.protocol.close()
         print("[INFO] Client thread exited")
 
-def main():
-    client = Client("raspitwo.local", 8000)
-    client.connect()
+    def report_loop_stats(self):
+        s = self.loop_stats.summary()
+        if s is None:
+            return
+        mode = "detached" if isinstance(self.gui, RemoteGUI) else "attached"
+        print(f"[LOOP] {s['rate']:.1f} Hz, jitter {s['jitter_ms']:.1f} ms, "
+              f"max gap {s['max_ms']:.1f} ms (GUI {mode})")
+
+def run_gui(client, tcp=False):
+    t0 = time.perf_counter()
+    from admin_gui import AdminGUI
+    from spec_gui import SpectatorGUI
+    from auth_window import AuthWindow
+    print(f"[STARTUP] core imports {IMPORT_SECONDS * 1000:.0f} ms, "
+          f"Tk GUI imports {(time.perf_counter() - t0) * 1000:.0f} ms")
 
     auth_win = AuthWindow(client)
     auth_win.mainloop()
@@ -128,11 +434,17 @@ def main():
         print("Authentication failed or cancelled")
         return
 
-    # Send UDP port registration using Protocol.CMDS['UDP_PORT']
-    client.protocol.send_json({"type": client.protocol.CMDS['UDP_PORT'], "port": client.udp_port})
-
     # Assign GUI and role
-    if getattr(auth_win, 'role', None) == "ADMIN":
+    is_admin = getattr(auth_win, 'role', None) == "ADMIN"
+    if is_admin:
+        if USE_THRESHOLD_LUT:
+            ImgUtils.enable_lut()
+        if USE_UDP_CONTROL and auth_win.control_port:
+            client.enable_udp_control(auth_win.control_port)
+
+    if GUI_PROCESS:
+        gui = RemoteGUI(is_admin)
+    elif is_admin:
         gui = AdminGUI()
         gui.is_admin = True
     else:
@@ -143,8 +455,87 @@ def main():
     gui.server = client
     gui.set_car_ip(f"{client.protocol.host}:{client.protocol.port}")
 
+    # Register for video; spectators also say how big their view is so the car picks a layer
+    client.register_udp(None if is_admin else gui.viewport())
+    if tcp:
+        client.use_tcp_video("requested on the command line")
+
     client.start()
     gui.mainloop()
 
+    if GUI_PROCESS:
+        client.running = False
+        client.join(timeout=1)
+        gui.close()
+
+def run_headless(client, username, password, log_path=None, interval=1.0, tcp=False):
+    """Log in as admin without any Tk and drive from the control loop on this thread."""
+    if username != "admin":
+        print("Headless mode drives the car and needs admin credentials")
+        return
+    client.send_message({"type": client.protocol.CMDS['LOGIN'], "username": username, "password": password})
+    response = client.recv_message()
+    if response.get("status") != "success":
+        print(f"Authentication failed: {response.get('message')}")
+        return
+    client.register_udp()
+    if tcp:
+        client.use_tcp_video("requested on the command line")
+
+    if USE_THRESHOLD_LUT:
+        ImgUtils.enable_lut()
+    if USE_UDP_CONTROL and response.get("control_port"):
+        client.enable_udp_control(response["control_port"])
+
+    gui = HeadlessTelemetry(log_path, interval)
+    client.gui = gui
+    gui.server = client
+    gui.set_car_ip(f"{client.protocol.host}:{client.protocol.port}")
+    print(f"[STARTUP] imports {IMPORT_SECONDS * 1000:.0f} ms, "
+          f"ready to drive {(time.perf_counter() - _T_START) * 1000:.0f} ms after start")
+    try:
+        client.run()
+    except KeyboardInterrupt:
+        client.running = False
+    finally:
+        client.report_loop_stats()
+        gui.close()
+
+def install_profile_signals(client):
+    """SIGUSR1 toggles profiling of this client; SIGUSR2 toggles profiling of the car (admin only)."""
+    if not hasattr(signal, "SIGUSR1"):
+        return  # not available on Windows
+    threading.Thread(target=client.run_profile_requests, name="profile-signals", daemon=True).start()
+    # SimpleQueue.put is reentrant, so it is safe even if the signal lands inside another put
+    signal.signal(signal.SIGUSR1, lambda signum, frame: client._profile_requests.put("client"))
+    signal.signal(signal.SIGUSR2, lambda signum, frame: client._profile_requests.put("server"))
+    print(f"[PROFILE] kill -USR1 {os.getpid()} profiles this client, -USR2 the car")
+
+def main():
+    parser = argparse.ArgumentParser(description="Car client: GUI, or headless autonomous driving")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--headless", action="store_true", help="drive without Tk; needs admin credentials")
+    parser.add_argument("--user", default=os.environ.get("CAR_USER"), help="or set CAR_USER")
+    parser.add_argument("--password", default=os.environ.get("CAR_PASSWORD"), help="or set CAR_PASSWORD")
+    parser.add_argument("--tcp-video", action="store_true", help="receive video over TCP from the start")
+    parser.add_argument("--telemetry", help="append one CSV line per frame to this file (headless)")
+    parser.add_argument("--log-interval", type=float, default=1.0, help="seconds between headless summaries")
+    args = parser.parse_args()
+
+    if args.headless and not (args.user and args.password):
+        parser.error("--headless needs --user/--password or CAR_USER/CAR_PASSWORD")
+    if args.headless and args.user != "admin":
+        parser.error("--headless drives the car and needs the admin account")
+
+    client = Client(args.host, args.port)
+    client.connect()
+    install_profile_signals(client)
+
+    if args.headless:
+        run_headless(client, args.user, args.password, args.telemetry, args.log_interval, args.tcp_video)
+    else:
+        run_gui(client, args.tcp_video)
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
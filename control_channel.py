@@ -0,0 +1,167 @@
+# Optional UDP channel for admin PWM commands.
+# TCP retransmission after a Wi-Fi hiccup delivers old steering commands late
+# and in order; over UDP each command carries a sequence number and send time
+# so the car applies only the newest one and drops anything too old.
+#
+# Datagram: length (4) + sealed JSON, sealed with the session's UDP context.
+# JSON: {"type": "pwm", ..., "seq": int, "sent": float (sender monotonic seconds)}
+
+import collections
+import json
+import socket
+import struct
+import time
+from session_crypto import ReplayError
+
+LENGTH = struct.Struct('I')
+MAX_COMMAND_AGE = 0.15   # seconds beyond the best observed one-way delay
+OFFSET_WINDOW   = 10.0   # seconds of history for the clock offset estimate
+
+class ControlSender:
+    """Client side: seals PWM commands and sends them to the car's control port."""
+
+    def __init__(self, protocol, server_addr, udp_socket=None):
+        self.protocol = protocol
+        self.server_addr = server_addr
+        self.sock = udp_socket or socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.seq = 0
+
+    def send(self, pwm):
+        msg = dict(pwm)
+        msg["seq"] = self.seq
+        msg["sent"] = time.monotonic()
+        self.seq += 1
+        sealed = self.protocol.crypto.udp_send.seal(json.dumps(msg).encode())
+        self.sock.sendto(LENGTH.pack(len(sealed)) + sealed, self.server_addr)
+
+    def close(self):
+        self.sock.close()
+
+class ControlReceiver:
+    """
+    Server side: opens control datagrams for one admin session and decides
+    whether each command is fresh enough to apply.
+
+    Sender and receiver clocks are unrelated, so the age of a command is its
+    apparent one-way delay (receive time - send time) minus the smallest
+    delay seen over the last OFFSET_WINDOW seconds.
+    """
+
+    def __init__(self, crypto, max_age=MAX_COMMAND_AGE):
+        self.crypto = crypto
+        self.max_age = max_age
+        self.newest_seq = -1
+        self._offsets = collections.deque()   # (recv_time, offset), increasing offsets
+        self.dropped = collections.Counter()
+        self.last_drop_reason = None
+        self.accepted = 0
+
+    def _drop(self, reason):
+        self.dropped[reason] += 1
+        self.last_drop_reason = reason
+        return None
+
+    def _min_offset(self, now, offset):
+        # Sliding-window minimum: drop expired samples and any that can never be the minimum again
+        while self._offsets and now - self._offsets[0][0] > OFFSET_WINDOW:
+            self._offsets.popleft()
+        while self._offsets and self._offsets[-1][1] >= offset:
+            self._offsets.pop()
+        self._offsets.append((now, offset))
+        return self._offsets[0][1]
+
+    def open(self, datagram, now=None):
+        """Return the command if it should be applied, else None (reason counted in dropped)."""
+        if now is None:
+            now = time.monotonic()
+        if len(datagram) < LENGTH.size:
+            return self._drop("invalid")
+        length = LENGTH.unpack_from(datagram)[0]
+        try:
+            msg = json.loads(self.crypto.udp_recv.open(datagram[LENGTH.size:LENGTH.size + length]))
+        except ReplayError:
+            # Counter already passed: a reordered or duplicated datagram
+            return self._drop("stale")
+        except ValueError:
+            return self._drop("invalid")
+
+        seq = msg.get("seq", -1)
+        if seq <= self.newest_seq:
+            return self._drop("stale")
+        self.newest_seq = seq
+
+        offset = now - msg.get("sent", now)
+        age = offset - self._min_offset(now, offset)
+        if age > self.max_age:
+            return self._drop("too_old")
+        self.accepted += 1
+        return msg
+
+def _loopback_check(commands=300, rate=50.0, max_delay=0.3, seed=0):
+    """
+    Send commands over loopback through a relay that delays each datagram by
+    a random amount (so they also arrive reordered) and print what the
+    receiver applied and dropped.
+    """
+    import heapq
+    import random
+    import threading
+    from session_crypto import SessionCrypto
+
+    rng = random.Random(seed)
+    key = b'k' * 32
+
+    class _Proto:
+        pass
+    client = _Proto()
+    client.crypto = SessionCrypto(key, 'aes-256-gcm', 'client')
+    receiver = ControlReceiver(SessionCrypto(key, 'aes-256-gcm', 'server'))
+
+    sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sink.bind(('127.0.0.1', 0))
+    sink.settimeout(0.5)
+    relay_in = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    relay_in.bind(('127.0.0.1', 0))
+    relay_in.settimeout(0.5)
+    relay_out = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def relay():
+        pending = []
+        while True:
+            try:
+                data, _ = relay_in.recvfrom(65535)
+                delay = max_delay * rng.random() ** 3   # mostly small, occasionally large
+                heapq.heappush(pending, (time.monotonic() + delay, data))
+            except socket.timeout:
+                if not pending:
+                    return
+            while pending and pending[0][0] <= time.monotonic():
+                relay_out.sendto(heapq.heappop(pending)[1], sink.getsockname())
+            relay_in.settimeout(max(0.001, pending[0][0] - time.monotonic()) if pending else 0.5)
+
+    applied = []
+
+    def receive():
+        while True:
+            try:
+                data, _ = sink.recvfrom(65535)
+            except socket.timeout:
+                return
+            msg = receiver.open(data)
+            if msg is not None:
+                applied.append(msg["seq"])
+
+    receiver_thread = threading.Thread(target=receive)
+    receiver_thread.start()
+    threading.Thread(target=relay, daemon=True).start()
+    sender = ControlSender(client, relay_in.getsockname())
+    for _ in range(commands):
+        sender.send({"type": "pwm", "left_duty": 0.07, "right_duty": 0.05, "left_freq": 30, "right_freq": 30})
+        time.sleep(1.0 / rate)
+    receiver_thread.join()
+    in_order = all(a < b for a, b in zip(applied, applied[1:]))
+    print(f"{commands} sent, {receiver.accepted} applied (in order: {in_order}), "
+          f"dropped: {dict(receiver.dropped)}")
+
+if __name__ == "__main__":
+    _loopback_check()
@@ -0,0 +1,152 @@
+# Parallel JPEG encoding for the frame loop.
+# cv2.imencode releases the GIL, so a few worker threads can encode
+# successive frames at the same time on the Pi's cores. Results are handed
+# on strictly in capture order; when encoding falls behind capture the
+# oldest frames still in flight are dropped so latency stays bounded.
+
+import collections
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ENCODE_WORKERS = 3   # the capture/send thread keeps the fourth core
+ENCODE_DEPTH   = 4   # frames in flight (encoding or waiting for their turn)
+
+class ParallelEncoder:
+    """
+    Encodes frames on a thread pool and calls on_encoded(payload, meta,
+    encode_seconds) from a single emitter thread in submission order.
+
+    submit() never blocks. If `depth` frames are already in flight the
+    oldest is dropped: cancelled if it has not started, otherwise its result
+    is discarded. A frame that finishes early waits in the reorder buffer
+    until every older frame has been emitted or dropped.
+    """
+
+    def __init__(self, encode, on_encoded, workers=ENCODE_WORKERS, depth=ENCODE_DEPTH):
+        if workers < 1 or depth < 1:
+            raise ValueError("Worker count and queue depth must be positive")
+        self.encode = encode
+        self.on_encoded = on_encoded
+        self.workers = workers
+        self.depth = depth
+        self.submitted = 0
+        self.emitted = 0
+        self.dropped = 0
+        self.errors = 0
+        self._pool = ThreadPoolExecutor(workers, thread_name_prefix='encode')
+        self._pending = collections.deque()   # (future, meta) in capture order
+        self._cond = threading.Condition()    # reentrant: done callbacks may run inside submit
+        self._running = False
+        self._emitter = threading.Thread(target=self._emit_loop, daemon=True)
+
+    def start(self):
+        self._running = True
+        self._emitter.start()
+
+    def backlog(self):
+        with self._cond:
+            return len(self._pending)
+
+    def _timed_encode(self, frame):
+        t0 = time.perf_counter()
+        payload = self.encode(frame)
+        return payload, time.perf_counter() - t0
+
+    def _wake(self, future):
+        with self._cond:
+            self._cond.notify()
+
+    def submit(self, frame, meta=None):
+        """Queue a frame for encoding; the caller must not modify it afterwards."""
+        with self._cond:
+            while len(self._pending) >= self.depth:
+                future, _ = self._pending.popleft()
+                future.cancel()
+                self.dropped += 1
+            future = self._pool.submit(self._timed_encode, frame)
+            self._pending.append((future, meta))
+            self.submitted += 1
+            future.add_done_callback(self._wake)
+
+    def _emit_loop(self):
+        while True:
+            with self._cond:
+                while self._running and not (self._pending and self._pending[0][0].done()):
+                    self._cond.wait()
+                if not self._running:
+                    return
+                future, meta = self._pending.popleft()
+            if future.cancelled():
+                continue
+            try:
+                payload, seconds = future.result()
+            except Exception as e:
+                self.errors += 1
+                print(f"[ERROR] Frame encode failed: {e}")
+                continue
+            self.emitted += 1
+            self.on_encoded(payload, meta, seconds)
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        return {
+            "submitted": self.submitted,
+            "emitted": self.emitted,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "backlog": self.backlog(),
+        }
+
+def _benchmark(frames=300, sizes=((480, 270), (1280, 720)), max_workers=4):
+    """
+    Achievable encode rate against worker count: frames are submitted as
+    fast as the pool accepts them (no drops) and fps is the emitted rate.
+    workers=0 is the old serial imencode loop.
+    """
+    import cv2
+    import numpy as np
+
+    rng = np.random.default_rng(0)
+    encode = lambda frame: cv2.imencode(".jpg", frame)[1]
+    for width, height in sizes:
+        noise = rng.integers(0, 255, (height // 8, width // 8, 3), dtype=np.uint8)
+        base = cv2.resize(noise, (width, height), interpolation=cv2.INTER_CUBIC)
+        images = [np.roll(base, i * 4, axis=1) for i in range(8)]
+        print(f"{width}x{height}:")
+
+        t0 = time.perf_counter()
+        for i in range(frames):
+            encode(images[i % len(images)])
+        serial = frames / (time.perf_counter() - t0)
+        print(f"  serial      {serial:6.1f} fps")
+
+        for workers in range(1, max_workers + 1):
+            order = []
+            done = threading.Event()
+
+            def on_encoded(payload, seq, seconds):
+                order.append(seq)
+                if seq == frames - 1:
+                    done.set()
+
+            encoder = ParallelEncoder(encode, on_encoded, workers, depth=2 * workers)
+            encoder.start()
+            t0 = time.perf_counter()
+            for i in range(frames):
+                while encoder.backlog() >= encoder.depth:
+                    time.sleep(0.0002)
+                encoder.submit(images[i % len(images)], i)
+            done.wait()
+            fps = frames / (time.perf_counter() - t0)
+            encoder.stop()
+            in_order = order == sorted(order)
+            print(f"  {workers} workers   {fps:6.1f} fps  x{fps / serial:.2f}  in order: {in_order}")
+
+if __name__ == "__main__":
+    _benchmark()
@@ -0,0 +1,99 @@
+# Stand-ins for the Pi's hardware so the car code can run off-device.
+# Set CAR_FAKE_HW=1 in the environment to make car.py use FakeGPIO.
+
+import os
+import threading
+
+FAKE_HW_ENV = "CAR_FAKE_HW"
+
+def fake_hw_enabled():
+    return os.environ.get(FAKE_HW_ENV, "") not in ("", "0")
+
+class FakeGPIO:
+    """Mimics the subset of RPi.GPIO used by MotorController and counts writes."""
+    BCM = 11
+    OUT = 0
+    LOW = 0
+    HIGH = 1
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.mode = None
+        self.pins = {}
+        self.write_counts = {}
+
+    def setmode(self, mode):
+        self.mode = mode
+
+    def setup(self, pin, direction):
+        with self._lock:
+            self.pins[pin] = self.LOW
+
+    def output(self, pin, value):
+        with self._lock:
+            self.pins[pin] = value
+            self.write_counts[pin] = self.write_counts.get(pin, 0) + 1
+
+    def writes(self, pins=None):
+        """Total writes, optionally restricted to the given pins."""
+        with self._lock:
+            if pins is None:
+                return sum(self.write_counts.values())
+            return sum(self.write_counts.get(p, 0) for p in pins)
+
+    def reset_counts(self):
+        with self._lock:
+            self.write_counts.clear()
+
+    def cleanup(self):
+        with self._lock:
+            self.pins.clear()
+
+GPIO = FakeGPIO()
+
+class FakeCamera:
+    """
+    Mimics the subset of Picamera2 used by CarController. Frames are RGB with
+    a purple lane line that sways over time; the first warmup seconds after
+    start() are black, like a real sensor settling its exposure.
+    """
+
+    def __init__(self, warmup=0.5):
+        import numpy as np
+        self._np = np
+        self.warmup = warmup
+        self.size = (640, 480)
+        self._started_at = None
+
+    def create_preview_configuration(self, main=None):
+        return {"main": dict(main or {})}
+
+    def configure(self, cfg):
+        self.size = tuple(cfg.get("main", {}).get("size", self.size))
+
+    def start(self):
+        import time
+        self._started_at = time.monotonic()
+
+    def capture_array(self):
+        import time
+        import cv2
+        np = self._np
+        if self._started_at is None:
+            raise RuntimeError("Camera not started")
+        w, h = self.size
+        frame = np.zeros((h, w, 3), np.uint8)
+        elapsed = time.monotonic() - self._started_at
+        if elapsed < self.warmup:
+            return frame
+        frame[:] = (90, 90, 90)
+        x = int(w / 2 + w / 5 * np.sin(elapsed))
+        # RGB purple; the server converts to BGR and rotates 180 degrees
+        cv2.line(frame, (x, 0), (w // 2, h - 1), (150, 40, 200), max(4, w // 40))
+        return frame
+
+    def stop(self):
+        self._started_at = None
+
+    def close(self):
+        pass
@@ -0,0 +1,121 @@
+# Recent encoded frames kept in a fixed, preallocated arena.
+# New clients are sent the newest frame straight away instead of waiting
+# for the next capture, and any client can ask to replay the last few
+# seconds. The arena is allocated once, so the history never grows memory.
+
+import collections
+import threading
+
+ARENA_BYTES = 8 * 1024 * 1024   # ~20 s of 480x270 JPEG at 20 fps
+MAX_FRAMES  = 1024
+
+RecordedFrame = collections.namedtuple('RecordedFrame', 'frame_id timestamp shape layer payload')
+
+class RecentFrames:
+    """
+    Circular byte arena plus an index of the frames stored in it.
+
+    Frames are written one after another, wrapping to the start of the
+    arena when the next one does not fit before the end; whatever older
+    frames the new one overlaps are evicted. Readers get copies, so a frame
+    being replayed can be overwritten safely.
+    """
+
+    def __init__(self, arena_bytes=ARENA_BYTES, max_frames=MAX_FRAMES):
+        self._arena = bytearray(arena_bytes)
+        self._view = memoryview(self._arena)
+        self.max_frames = max_frames
+        self._index = collections.deque()   # (frame_id, timestamp, shape, layer, offset, length), oldest first
+        self._head = 0
+        self._lock = threading.Lock()
+        self.added = 0
+        self.evicted = 0
+
+    @property
+    def capacity(self):
+        return len(self._arena)
+
+    def add(self, payload, frame_id, timestamp, shape, layer):
+        """Store an encoded frame; returns False if it is larger than the arena."""
+        n = len(payload)
+        if n > len(self._arena):
+            return False
+        with self._lock:
+            wrapped = self._head + n > len(self._arena)
+            start = 0 if wrapped else self._head
+            end = start + n
+            # Oldest first: the frames left past the head when wrapping, then whatever the new one covers
+            while self._index and (len(self._index) >= self.max_frames or
+                                   (wrapped and self._index[0][4] >= self._head) or
+                                   self._overlaps(self._index[0], start, end)):
+                self._index.popleft()
+                self.evicted += 1
+            self._view[start:end] = payload
+            self._index.append((frame_id, timestamp, shape, layer, start, n))
+            self._head = end
+            self.added += 1
+        return True
+
+    @staticmethod
+    def _overlaps(entry, start, end):
+        offset, length = entry[4], entry[5]
+        return offset < end and start < offset + length
+
+    def _copy(self, entry):
+        frame_id, timestamp, shape, layer, offset, length = entry
+        return RecordedFrame(frame_id, timestamp, shape, layer, bytes(self._view[offset:offset + length]))
+
+    def latest(self):
+        with self._lock:
+            return self._copy(self._index[-1]) if self._index else None
+
+    def window(self, seconds):
+        """(frame_id, timestamp) of the stored frames from the last `seconds` of capture time."""
+        with self._lock:
+            if not self._index:
+                return []
+            since = self._index[-1][1] - seconds
+            return [(entry[0], entry[1]) for entry in self._index if entry[1] >= since]
+
+    def get(self, frame_id):
+        """Copy of a stored frame, or None if it has been evicted."""
+        with self._lock:
+            if not self._index or frame_id < self._index[0][0]:
+                return None
+            for entry in reversed(self._index):
+                if entry[0] == frame_id:
+                    return self._copy(entry)
+                if entry[0] < frame_id:
+                    break
+        return None
+
+    def stats(self):
+        with self._lock:
+            frames = len(self._index)
+            used = sum(entry[5] for entry in self._index)
+            span = self._index[-1][1] - self._index[0][1] if frames else 0.0
+        return {"frames": frames, "bytes": used, "seconds": span,
+                "added": self.added, "evicted": self.evicted}
+
+def _check(frames=5000, seed=0):
+    """Fill a small arena with random-sized frames and verify every stored copy is intact."""
+    import random
+
+    rng = random.Random(seed)
+    ring = RecentFrames(arena_bytes=256 * 1024, max_frames=64)
+    sizes = {}
+    for i in range(frames):
+        n = rng.randint(2000, 40000)
+        ring.add(bytes([i % 251]) * n, i, i / 20.0, (270, 480, 3), 'full')
+        sizes[i] = n
+        if i % 97 == 0:
+            for frame_id, _ in ring.window(2.0):
+                frame = ring.get(frame_id)
+                assert frame is not None and len(frame.payload) == sizes[frame_id]
+                assert frame.payload == bytes([frame_id % 251]) * sizes[frame_id], frame_id
+    s = ring.stats()
+    print(f"{s['added']} frames added, {s['evicted']} evicted, {s['frames']} held "
+          f"({s['bytes']} of {ring.capacity} bytes, {s['seconds']:.2f} s), all copies intact")
+
+if __name__ == "__main__":
+    _check()
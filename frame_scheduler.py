@@ -0,0 +1,148 @@
+# Frame pacing and per-client send queues for the car server.
+# FrameScheduler keeps the frame loop on time.monotonic deadlines, and
+# ClientSendQueue gives every client a small bounded queue with counters.
+
+import collections
+import threading
+import time
+
+SKIP_POLICIES = ('skip', 'rebase')
+
+class FrameScheduler:
+    """
+    Paces a loop at a fixed rate using time.monotonic deadlines.
+
+    Each deadline is the previous one plus exactly one period, so a slow
+    frame is paid back by a shorter sleep on the next one instead of
+    accumulating. When the loop overruns one or more whole periods the
+    skip policy decides what happens:
+      'skip'   - drop the missed slots and stay phase-aligned.
+      'rebase' - restart the schedule one period from now.
+    """
+
+    def __init__(self, rate, skip_policy='skip', history=512):
+        if rate <= 0:
+            raise ValueError("Frame rate must be positive")
+        if skip_policy not in SKIP_POLICIES:
+            raise ValueError(f"Unknown skip policy: {skip_policy}")
+        self.period = 1.0 / rate
+        self.skip_policy = skip_policy
+        self.ticks = 0
+        self.skipped = 0
+        self._deadline = None
+        self._lateness = collections.deque(maxlen=history)
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """
+        Sleep until the next deadline and return how late we woke up (seconds).
+        """
+        now = time.monotonic()
+        if self._deadline is None:
+            self._deadline = now
+        if now < self._deadline:
+            time.sleep(self._deadline - now)
+            now = time.monotonic()
+
+        lateness = now - self._deadline
+        with self._lock:
+            self._lateness.append(lateness)
+        self.ticks += 1
+
+        self._deadline += self.period
+        if now >= self._deadline:
+            missed = int((now - self._deadline) / self.period) + 1
+            self.skipped += missed
+            if self.skip_policy == 'skip':
+                self._deadline += missed * self.period
+            else:
+                self._deadline = now + self.period
+        return lateness
+
+    def lateness_stats(self):
+        """
+        Summary of recent schedule lateness in seconds:
+        count, mean, p50, p90, p99, max, plus total ticks and skipped slots.
+        """
+        with self._lock:
+            samples = sorted(self._lateness)
+        stats = {"ticks": self.ticks, "skipped": self.skipped, "count": len(samples)}
+        if not samples:
+            return stats
+        n = len(samples)
+        stats.update({
+            "mean": sum(samples) / n,
+            "p50": samples[int(0.50 * (n - 1))],
+            "p90": samples[int(0.90 * (n - 1))],
+            "p99": samples[int(0.99 * (n - 1))],
+            "max": samples[-1],
+        })
+        return stats
+
+class ClientSendQueue:
+    """
+    Bounded per-client queue of outgoing frames.
+
+    put() never blocks: when the queue is full the oldest frame is dropped,
+    so a slow client only ever sees the freshest frames. flush() sends
+    queued items until the socket would block, which is counted as
+    backpressure and leaves the head item queued for the next tick.
+    skip() records a frame the scheduler chose not to offer this client.
+    put() and flush() may be called from different threads (frames from the
+    encoder, keep-alives from the frame loop); a lock keeps them in order.
+    """
+
+    def __init__(self, maxlen=2):
+        self.maxlen = maxlen
+        self._queue = collections.deque()
+        self._lock = threading.Lock()
+        self.sent = 0
+        self.dropped = 0
+        self.backpressure = 0
+        self.errors = 0
+        self.skipped = 0
+
+    def __len__(self):
+        return len(self._queue)
+
+    def put(self, item):
+        with self._lock:
+            if len(self._queue) >= self.maxlen:
+                self._queue.popleft()
+                self.dropped += 1
+            self._queue.append(item)
+
+    def skip(self):
+        self.skipped += 1
+
+    def flush(self, send):
+        """
+        Call send(item) for each queued item in order.
+        Returns True if the queue was drained, False if the socket pushed back.
+        Other exceptions drop the offending item and are re-raised.
+        """
+        with self._lock:
+            while self._queue:
+                try:
+                    send(self._queue[0])
+                except BlockingIOError:
+                    self.backpressure += 1
+                    return False
+                except Exception:
+                    self._queue.popleft()
+                    self.dropped += 1
+                    self.errors += 1
+                    raise
+                self._queue.popleft()
+                self.sent += 1
+            return True
+
+    def stats(self):
+        return {
+            "queued": len(self._queue),
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "backpressure": self.backpressure,
+            "skipped": self.skipped,
+            "errors": self.errors,
+        }
@@ -0,0 +1,97 @@
+# Zero-copy UDP send path for encrypted frames.
+# The JPEG payload is encrypted straight into a preallocated buffer and the
+# datagram is assembled by the kernel from a header buffer and the ciphertext
+# buffer with socket.sendmsg, so no frame-sized objects are created per send.
+
+import socket
+import struct
+import time
+from session_crypto import HEADER_SIZE
+
+LENGTH = struct.Struct('I')   # same length prefix as the rest of Protocol
+MAX_DATAGRAM = 65507          # largest IPv4 UDP payload
+
+class FrameSender:
+    """
+    Sends encrypted frames over UDP for one session direction.
+    Datagram layout: length (4) + counter (8) + tag (16) + ciphertext.
+    """
+
+    def __init__(self, context, max_datagram=MAX_DATAGRAM):
+        self._context = context
+        self._header = bytearray(LENGTH.size + HEADER_SIZE)
+        self._header_view = memoryview(self._header)
+        self._seal_header = self._header_view[LENGTH.size:]
+        self._body = bytearray(max_datagram - len(self._header))
+        self._body_view = memoryview(self._body)
+        self.max_payload = len(self._body)
+        self.last_encrypt_seconds = 0.0
+        self.last_send_seconds = 0.0
+
+    def send(self, payload, addr, udp_socket):
+        """
+        Encrypt payload (a bytes-like object) and send it to addr.
+        Raises BlockingIOError unchanged so callers can apply backpressure.
+        """
+        n = len(payload)
+        if n > self.max_payload:
+            raise ValueError(f"Frame of {n} bytes does not fit in one datagram")
+        body = self._body_view[:n]
+        t0 = time.perf_counter()
+        self._context.seal_into(payload, self._seal_header, body)
+        LENGTH.pack_into(self._header, 0, HEADER_SIZE + n)
+        t1 = time.perf_counter()
+        sent = udp_socket.sendmsg([self._header_view, body], (), 0, addr)
+        self.last_encrypt_seconds = t1 - t0
+        self.last_send_seconds = time.perf_counter() - t1
+        return sent
+
+def _allocation_check(sends=500, payload_size=30000):
+    """
+    Send frames over loopback under tracemalloc and report what the steady
+    state allocates. Retained memory must not grow with the number of sends
+    and no single allocation may come close to the payload size.
+    """
+    import tracemalloc
+    from Crypto import Random
+    from session_crypto import SessionCrypto, SUITES
+
+    sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sink.bind(('127.0.0.1', 0))
+    sink.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 16)
+    sink.setblocking(False)
+    out = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    addr = sink.getsockname()
+    payload = memoryview(Random.get_random_bytes(payload_size))
+    drain = bytearray(MAX_DATAGRAM)
+
+    for suite in SUITES:
+        sender = FrameSender(SessionCrypto(b'k' * 32, suite, 'server').udp_send)
+
+        def burst(count):
+            for _ in range(count):
+                sender.send(payload, addr, out)
+                try:
+                    sink.recv_into(drain)
+                except BlockingIOError:
+                    pass
+
+        burst(50)  # warm up caches and lazily created objects
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        burst(sends)
+        after = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        diff = after.compare_to(before, 'lineno')
+        retained = sum(d.size_diff for d in diff)
+        print(f"{suite}: {sends} sends, retained {retained} B, peak {peak} B")
+        assert retained < 4096, "steady-state send path retains memory"
+        assert peak < payload_size // 2, "steady-state send path allocates frame-sized buffers"
+
+    sink.close()
+    out.close()
+
+if __name__ == "__main__":
+    _allocation_check()
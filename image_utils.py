@@ -1,17 +1,120 @@
+import hashlib
+import os
+import time
 import cv2
 import numpy as np
 
+LUT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "carproject")
+
+class ThresholdLUT:
+    """
+    Precomputed BGR -> mask table for fixed HSV bounds.
+
+    With bits=8 every BGR colour has its own entry and the result matches
+    cvtColor + inRange exactly; fewer bits quantise each channel and give a
+    smaller table at the cost of exactness. Tables are cached on disk keyed
+    by the bounds, the bit depth and the OpenCV version.
+
+    The gather is random access into a 16 MB table (2-256 KB with fewer
+    bits), which on 480x270 frames is slower than the SIMD cvtColor +
+    inRange path, so ImgUtils only uses it when enable_lut() is called.
+    """
+
+    def __init__(self, lower, upper, bits=8, cache_dir=LUT_CACHE_DIR):
+        if not 1 <= bits <= 8:
+            raise ValueError("bits must be between 1 and 8")
+        self.lower = np.array(lower, dtype=np.uint8)
+        self.upper = np.array(upper, dtype=np.uint8)
+        self.bits = bits
+        self.shift = 8 - bits
+        self.cache_path = os.path.join(cache_dir, f"threshold_lut_{self._key()}.npy") if cache_dir else None
+        self.table = self._load() if self.cache_path else None
+        if self.table is None:
+            self.table = self._build()
+            self._save()
+        self._index = None
+
+    def _key(self):
+        desc = f"{self.lower.tolist()}-{self.upper.tolist()}-{self.bits}-{cv2.__version__}"
+        return hashlib.sha1(desc.encode()).hexdigest()[:16]
+
+    def _build(self):
+        levels = 1 << self.bits
+        step = 1 << self.shift
+        values = np.minimum(np.arange(levels) * step + step // 2, 255).astype(np.uint8)
+        g, r = np.meshgrid(values, values, indexing='ij')
+        plane = np.empty((levels, levels, 3), np.uint8)
+        plane[..., 1] = g
+        plane[..., 2] = r
+        table = np.empty(levels ** 3, np.uint8)
+        # One G x R plane per blue level keeps peak memory small on the Pi
+        for i, b in enumerate(values):
+            plane[..., 0] = b
+            hsv = cv2.cvtColor(plane, cv2.COLOR_BGR2HSV)
+            table[i * levels * levels:(i + 1) * levels * levels] = cv2.inRange(hsv, self.lower, self.upper).ravel()
+        return table
+
+    def _load(self):
+        try:
+            packed = np.load(self.cache_path)
+        except (OSError, ValueError):
+            return None
+        table = np.unpackbits(packed)[:(1 << self.bits) ** 3] * np.uint8(255)
+        return table
+
+    def _save(self):
+        if not self.cache_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            np.save(self.cache_path, np.packbits(self.table > 0))
+        except OSError as e:
+            print(f"[WARNING] Could not cache threshold table: {e}")
+
+    def apply(self, frame):
+        """Map a BGR uint8 frame to a 0/255 mask through the table."""
+        h, w = frame.shape[:2]
+        if self._index is None or self._index.shape != (h, w):
+            self._index = np.empty((h, w), np.uint32)
+        index = self._index
+        np.right_shift(frame[..., 0], self.shift, out=index, dtype=np.uint32)
+        index <<= self.bits
+        index |= frame[..., 1] >> self.shift
+        index <<= self.bits
+        index |= frame[..., 2] >> self.shift
+        return self.table[index]
+
 class ImgUtils:
     """Utilities for image thresholding, warping, and resizing."""
-    
-    @staticmethod
-    def threshold(frame):
+    HSV_LOWER = (125, 50, 50)
+    HSV_UPPER = (160, 255, 255)
+    _lut = None
+
+    @classmethod
+    def enable_lut(cls, bits=8):
+        """Build (or load from cache) the lookup table used by threshold()."""
+        cls._lut = ThresholdLUT(cls.HSV_LOWER, cls.HSV_UPPER, bits=bits)
+        return cls._lut
+
+    @classmethod
+    def disable_lut(cls):
+        cls._lut = None
+
+    @classmethod
+    def threshold(cls, frame):
         """Convert a BGR frame to HSV and apply color thresholding."""
+        if cls._lut is not None:
+            return cls._lut.apply(frame)
+        return cls.threshold_hsv(frame)
+
+    @classmethod
+    def threshold_hsv(cls, frame):
+        """The cvtColor + inRange path, used when no lookup table is enabled."""
         hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
-        lower = np.array([125, 50, 50])
-        upper = np.array([160, 255, 255])
+        lower = np.array(cls.HSV_LOWER)
+        upper = np.array(cls.HSV_UPPER)
         return cv2.inRange(hsv, lower, upper)
-    
+
     @staticmethod
     def warp(mask, w_sub=50, h_sub=120):
         """Warp the binary mask to a bird’s-eye view."""
@@ -20,8 +123,48 @@ class ImgUtils:
         pts2 = np.float32([[0, 0], [w, 0], [0, h], [w, h]])
         matrix = cv2.getPerspectiveTransform(pts1, pts2)
         return cv2.warpPerspective(mask, matrix, (w, h))
-    
+
     @staticmethod
     def resize(image, target_w, target_h):
         """Resize image to exactly target_w x target_h (ignores aspect ratio)."""
-        return cv2.resize(image, (target_w, target_h))
\ No newline at end of file
+        return cv2.resize(image, (target_w, target_h))
+
+def _all_colours():
+    """A 4096x4096 BGR image holding each of the 2^24 colours exactly once."""
+    index = np.arange(1 << 24, dtype=np.uint32)
+    image = np.empty((1 << 24, 3), np.uint8)
+    image[:, 0] = index >> 16
+    image[:, 1] = (index >> 8) & 0xFF
+    image[:, 2] = index & 0xFF
+    return image.reshape(4096, 4096, 3)
+
+def _compare(frames=50, h=270, w=480, bits=(8, 6, 5)):
+    """
+    Assert the 8-bit table matches the HSV path for every BGR colour, then
+    time the HSV path and each table depth per frame.
+    """
+    t0 = time.perf_counter()
+    lut = ThresholdLUT(ImgUtils.HSV_LOWER, ImgUtils.HSV_UPPER)
+    print(f"table ready in {time.perf_counter() - t0:.2f}s ({lut.cache_path})")
+
+    colours = _all_colours()
+    mismatched = int(np.count_nonzero(lut.apply(colours) != ImgUtils.threshold_hsv(colours)))
+    assert mismatched == 0, f"{mismatched} of 2^24 colours differ from the HSV path"
+    print("8-bit table matches the HSV path for all 2^24 colours")
+    del colours
+
+    rng = np.random.default_rng(0)
+    samples = [rng.integers(0, 256, (h, w, 3), dtype=np.uint8) for _ in range(frames)]
+    paths = [("hsv", ImgUtils.threshold_hsv)]
+    for b in bits:
+        table = lut if b == 8 else ThresholdLUT(ImgUtils.HSV_LOWER, ImgUtils.HSV_UPPER, bits=b)
+        paths.append((f"lut {b}-bit", table.apply))
+    for name, fn in paths:
+        fn(samples[0])
+        t0 = time.perf_counter()
+        for f in samples:
+            fn(f)
+        print(f"{name:10s} {(time.perf_counter() - t0) / frames * 1e3:.3f} ms/frame")
+
+if __name__ == "__main__":
+    _compare()
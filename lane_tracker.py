@@ -0,0 +1,138 @@
+# Windowed lane tracker for the warped (bird's-eye) lane mask.
+# The first frame is seeded from a column histogram and searched with sliding
+# windows; later frames only scan a narrow band around the previous fit, so a
+# stray pixel elsewhere in the mask cannot pull the lane position.
+
+import time
+import numpy as np
+import cv2
+
+class LaneTracker:
+    """Tracks a single lane line and reports its centroid and a confidence."""
+
+    def __init__(self, n_windows=9, margin=40, min_pixels=30, min_confidence=0.35):
+        self.n_windows = n_windows
+        self.margin = margin              # half width of each search window, in pixels
+        self.min_pixels = min_pixels      # pixels needed for a window to count as a hit
+        self.min_confidence = min_confidence
+        self.fit = None                   # (slope, intercept) of x = slope * y + intercept
+        self.confidence = 0.0
+        self.pixels_scanned = 0           # mask pixels touched by the last locate()
+
+    def reset(self):
+        self.fit = None
+        self.confidence = 0.0
+
+    def locate(self, mask):
+        """
+        Find the lane in a binary mask.
+        Returns (cx, confidence); cx is None when the lane is lost, in which
+        case the next call re-seeds from the histogram.
+        """
+        h, w = mask.shape
+        win_h = max(1, h // self.n_windows)
+        self.pixels_scanned = 0
+
+        if self.fit is None:
+            bottom = mask[h // 2:, :]
+            self.pixels_scanned += bottom.size
+            histogram = cv2.reduce(bottom, 0, cv2.REDUCE_SUM, dtype=cv2.CV_32S).ravel()
+            if histogram.max() == 0:
+                self.confidence = 0.0
+                return None, 0.0
+            x_current = int(np.argmax(histogram))
+        else:
+            x_current = None
+
+        # Running sums for the least-squares fit x = slope * y + intercept,
+        # built from each window's moments instead of its pixel coordinates
+        n = sx = sy = sxy = syy = 0.0
+        hits = 0
+        for i in range(self.n_windows):
+            y1 = h - i * win_h
+            y0 = max(0, y1 - win_h)
+            if self.fit is not None:
+                x_center = int(self.fit[0] * (y0 + y1) / 2 + self.fit[1])
+            else:
+                x_center = x_current
+            x0 = max(0, x_center - self.margin)
+            x1 = min(w, x_center + self.margin)
+            if x0 >= x1:
+                continue
+            window = mask[y0:y1, x0:x1]
+            self.pixels_scanned += window.size
+            m = cv2.moments(window, binaryImage=True)
+            count = m["m00"]
+            if count >= self.min_pixels:
+                hits += 1
+                # Shift window moments to mask coordinates
+                n += count
+                sx += m["m10"] + x0 * count
+                sy += m["m01"] + y0 * count
+                sxy += m["m11"] + x0 * m["m01"] + y0 * m["m10"] + x0 * y0 * count
+                syy += m["m02"] + 2 * y0 * m["m01"] + y0 * y0 * count
+                if self.fit is None:
+                    # Sliding windows follow the line as it bends
+                    x_current = int(m["m10"] / count) + x0
+
+        self.confidence = hits / self.n_windows
+        if self.confidence < self.min_confidence:
+            self.fit = None
+            return None, self.confidence
+
+        cx = sx / n
+        var_y = n * syy - sy * sy
+        if var_y > 1e-9 * n * n:
+            slope = (n * sxy - sx * sy) / var_y
+            intercept = (sx - slope * sy) / n
+        else:
+            slope, intercept = 0.0, cx
+        self.fit = (float(slope), float(intercept))
+        return float(cx), self.confidence
+
+def moments_centroid(mask):
+    """The whole-image centroid the PID controller used before the tracker."""
+    w = mask.shape[1]
+    M = cv2.moments(mask)
+    return int(M["m10"] / M["m00"]) if M["m00"] != 0 else w // 2
+
+def _synthetic_frames(n=200, h=270, w=480, seed=0):
+    """Yield (mask, true_cx) for a swaying lane line with random stray blobs."""
+    rng = np.random.default_rng(seed)
+    for i in range(n):
+        mask = np.zeros((h, w), np.uint8)
+        base = w / 2 + 80 * np.sin(i / 20)
+        top = base + 40 * np.sin(i / 13)
+        cv2.line(mask, (int(base), h - 1), (int(top), 0), 255, 14)
+        ys, xs = np.nonzero(mask)
+        true_cx = xs.mean()
+        for _ in range(rng.integers(0, 4)):
+            cx, cy = int(rng.integers(0, w)), int(rng.integers(0, h))
+            cv2.circle(mask, (cx, cy), int(rng.integers(4, 16)), 255, -1)
+        yield mask, true_cx
+
+def _compare():
+    """Print centroid error and per-frame cost for moments vs the tracker."""
+    frames = list(_synthetic_frames())
+    tracker = LaneTracker()
+    results = {"moments": ([], 0.0, 0), "tracker": ([], 0.0, 0)}
+
+    errors, t0 = [], time.perf_counter()
+    for mask, truth in frames:
+        errors.append(abs(moments_centroid(mask) - truth))
+    results["moments"] = (errors, time.perf_counter() - t0, frames[0][0].size * len(frames))
+
+    errors, scanned, t0 = [], 0, time.perf_counter()
+    for mask, truth in frames:
+        cx, _ = tracker.locate(mask)
+        scanned += tracker.pixels_scanned
+        errors.append(abs((cx if cx is not None else mask.shape[1] // 2) - truth))
+    results["tracker"] = (errors, time.perf_counter() - t0, scanned)
+
+    total = frames[0][0].size * len(frames)
+    for name, (errs, dt, pixels) in results.items():
+        print(f"{name:8s} mean err {np.mean(errs):6.2f}px  max err {np.max(errs):6.1f}px  "
+              f"{dt / len(frames) * 1e6:7.1f} us/frame  scanned {pixels / total:5.1%} of pixels")
+
+if __name__ == "__main__":
+    _compare()
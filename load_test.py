@@ -0,0 +1,203 @@
+# Headless spectator load generator for CarRemoteServerApp.
+#
+# Opens N concurrent clients that each do the real key exchange, signup or
+# login and UDP port registration, then receive and decode frames, and
+# reports handshake latency, received fps, loss and decode time per client
+# and in aggregate. To find scaling limits on one Linux box, raise the
+# server's spectator limit (4 by default) above the client count:
+#
+#   CAR_FAKE_HW=1 CAR_MAX_SPECTATORS=64 python server_main.py
+#   python load_test.py --host 127.0.0.1 -n 8 --duration 30
+
+import argparse
+import socket
+import threading
+import time
+import cv2
+import numpy as np
+from protocol import Protocol, ConnectionClosedError
+from session_crypto import ReplayError
+
+def _percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[int(q * (len(values) - 1))]
+
+class HeadlessSpectator(threading.Thread):
+    """One headless spectator: handshake, then receive and decode frames until duration ends."""
+
+    def __init__(self, index, host, port, username, password, duration, viewport=None):
+        super().__init__(daemon=True)
+        self.viewport = viewport
+        self.index = index
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.duration = duration
+        self.error = None
+        self.connect_seconds = None
+        self.key_exchange_seconds = None
+        self.auth_seconds = None
+        self.first_frame_seconds = None
+        self.frames = 0
+        self.replays = 0
+        self.keepalives = 0
+        self.decode_times = []
+        self.bytes_received = 0
+        self.receive_seconds = 0.0
+        self._first_counter = None
+        self._keepalives_before_first = 0
+        self._last_counter = None
+
+    def run(self):
+        protocol = Protocol('client', self.host, self.port)
+        udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        udp_socket.bind(('', 0))
+        udp_socket.settimeout(0.5)
+        try:
+            self._handshake(protocol, udp_socket)
+            self._receive(protocol, udp_socket)
+        except (ConnectionClosedError, OSError, ValueError) as e:
+            self.error = str(e) or type(e).__name__
+        finally:
+            protocol.close()
+            udp_socket.close()
+
+    def _handshake(self, protocol, udp_socket):
+        t0 = time.perf_counter()
+        protocol.connect()
+        t1 = time.perf_counter()
+        protocol.key_exchange()
+        t2 = time.perf_counter()
+        protocol.send_json({"type": Protocol.CMDS['SIGNUP'], "username": self.username,
+                            "password": self.password, "age": 0})
+        reply = protocol.recv_json()
+        if reply.get("status") != "success" and reply.get("message") == "Username exists":
+            protocol.send_json({"type": Protocol.CMDS['LOGIN'], "username": self.username,
+                                "password": self.password})
+            reply = protocol.recv_json()
+        if reply.get("status") != "success":
+            raise ValueError(reply.get("message", "authentication failed"))
+        t3 = time.perf_counter()
+        registration = {"type": Protocol.CMDS['UDP_PORT'], "port": udp_socket.getsockname()[1]}
+        if self.viewport:
+            registration["viewport"] = list(self.viewport)
+        protocol.send_json(registration)
+        self.connect_seconds = t1 - t0
+        self.key_exchange_seconds = t2 - t1
+        self.auth_seconds = t3 - t2
+        self._t_registered = time.perf_counter()
+        # Drain status messages so the server's TCP sends never block
+        threading.Thread(target=self._drain, args=(protocol,), daemon=True).start()
+
+    def _drain(self, protocol):
+        try:
+            while True:
+                protocol.recv_json()
+        except (ConnectionClosedError, OSError, ValueError):
+            pass
+
+    def _receive(self, protocol, udp_socket):
+        counter = protocol.crypto.udp_recv
+        t_start = time.perf_counter()
+        while time.perf_counter() - t_start < self.duration:
+            try:
+                jpeg = protocol.recv_jpeg_udp(udp_socket)
+            except socket.timeout:
+                continue
+            except ReplayError:
+                self.replays += 1
+                continue
+            if not jpeg:
+                # Keep-alive in place of an unchanged frame
+                self.keepalives += 1
+                if self._first_counter is not None:
+                    self._last_counter = counter.last_seen
+                continue
+            self.bytes_received += len(jpeg)
+            t_decode = time.perf_counter()
+            frame = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR)
+            if frame is None:
+                continue
+            self.decode_times.append(time.perf_counter() - t_decode)
+            if self.first_frame_seconds is None:
+                self.first_frame_seconds = t_decode - self._t_registered
+                self._t_first = t_decode
+                self._first_counter = counter.last_seen
+                self._keepalives_before_first = self.keepalives
+            self._last_counter = counter.last_seen
+            self.frames += 1
+        if self.frames > 1:
+            self.receive_seconds = time.perf_counter() - self._t_first
+
+    @property
+    def fps(self):
+        return (self.frames - 1) / self.receive_seconds if self.receive_seconds > 0 else 0.0
+
+    @property
+    def loss(self):
+        """Fraction of datagrams sent to us that never arrived, from the session counter gaps."""
+        if self._first_counter is None:
+            return 0.0
+        expected = self._last_counter - self._first_counter + 1
+        received = self.frames + self.keepalives - self._keepalives_before_first
+        return 1.0 - received / expected if expected > 0 else 0.0
+
+    def summary(self):
+        if self.error is not None:
+            return f"client {self.index:3d}: FAILED ({self.error})"
+        first = f"{self.first_frame_seconds * 1000:7.1f}" if self.first_frame_seconds is not None else "      -"
+        return (f"client {self.index:3d}: connect {self.connect_seconds * 1000:6.1f} ms  "
+                f"kex {self.key_exchange_seconds * 1000:7.1f} ms  auth {self.auth_seconds * 1000:6.1f} ms  "
+                f"first frame {first} ms  {self.fps:5.1f} fps  keep-alives {self.keepalives:4d}  loss {self.loss:5.1%}  "
+                f"{self.bytes_received / max(1, self.frames) / 1000:5.1f} kB/frame  "
+                f"decode p50 {_percentile(self.decode_times, 0.5) * 1000:5.2f} ms "
+                f"p95 {_percentile(self.decode_times, 0.95) * 1000:5.2f} ms")
+
+def run_load_test(host, port, clients, duration, user_prefix, password, ramp, viewport=None):
+    spectators = []
+    for i in range(clients):
+        spectator = HeadlessSpectator(i, host, port, f"{user_prefix}{i}", password, duration, viewport)
+        spectator.start()
+        spectators.append(spectator)
+        time.sleep(ramp)
+    for spectator in spectators:
+        spectator.join()
+
+    for spectator in spectators:
+        print(spectator.summary())
+
+    ok = [s for s in spectators if s.error is None]
+    print(f"\n{len(ok)}/{len(spectators)} clients connected")
+    if not ok:
+        return spectators
+    handshakes = [s.connect_seconds + s.key_exchange_seconds + s.auth_seconds for s in ok]
+    decode = [t for s in ok for t in s.decode_times]
+    print(f"handshake   p50 {_percentile(handshakes, 0.5) * 1000:.1f} ms  "
+          f"max {max(handshakes) * 1000:.1f} ms")
+    print(f"fps         mean {sum(s.fps for s in ok) / len(ok):.1f}  min {min(s.fps for s in ok):.1f}")
+    print(f"loss        mean {sum(s.loss for s in ok) / len(ok):.1%}  max {max(s.loss for s in ok):.1%}")
+    print(f"decode      p50 {_percentile(decode, 0.5) * 1000:.2f} ms  p95 {_percentile(decode, 0.95) * 1000:.2f} ms")
+    frames = sum(s.frames for s in ok)
+    print(f"bytes       {sum(s.bytes_received for s in ok) / max(1, frames) / 1000:.1f} kB/frame")
+    return spectators
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless spectator load test for the car server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("-n", "--clients", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds each client receives frames")
+    parser.add_argument("--user-prefix", default="loadtest")
+    parser.add_argument("--password", default="loadtest")
+    parser.add_argument("--ramp", type=float, default=0.1, help="seconds between client starts")
+    parser.add_argument("--viewport", help="WIDTHxHEIGHT each client reports, to test simulcast layers")
+    args = parser.parse_args()
+    viewport = tuple(int(v) for v in args.viewport.lower().split("x")) if args.viewport else None
+    run_load_test(args.host, args.port, args.clients, args.duration,
+                  args.user_prefix, args.password, args.ramp, viewport)
+
+if __name__ == "__main__":
+    main()
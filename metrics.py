@@ -0,0 +1,187 @@
+# Minimal Prometheus-style metrics for the car server.
+# Metrics are plain objects updated in place from hot paths; an HTTP thread
+# renders them in the Prometheus text exposition format on demand.
+
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{n}="{_escape(str(v))}"' for n, v in zip(names, values))
+    return '{' + pairs + '}'
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+class _Metric:
+    TYPE = 'untyped'
+
+    def __init__(self, name, help_text, labelnames=(), registry=None):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children = {}
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def labels(self, *values):
+        """Return the child for one combination of label values, creating it if needed."""
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def children(self):
+        """List of (label values, child) pairs."""
+        with self._lock:
+            return list(self._children.items())
+
+    def remove(self, *values):
+        with self._lock:
+            self._children.pop(tuple(str(v) for v in values), None)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.TYPE}']
+        with self._lock:
+            children = list(self._children.items())
+        for key, child in children:
+            lines.extend(child.render(self.name, _format_labels(self.labelnames, key)))
+        return lines
+
+class _Value:
+    __slots__ = ('value', '_lock', '_function')
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+        self._function = None
+
+    def inc(self, amount=1.0):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1.0):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value):
+        self.value = float(value)  # bools would render as True/False, which scrapers reject
+
+    def set_function(self, function):
+        """Evaluate function() at scrape time instead of storing a value."""
+        self._function = function
+
+    def get(self):
+        return float(self._function()) if self._function is not None else self.value
+
+    def render(self, name, labels):
+        return [f'{name}{labels} {self.get()}']
+
+class _SummaryValue:
+    __slots__ = ('sum', 'count', '_lock')
+
+    def __init__(self):
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self.sum += value
+            self.count += 1
+
+    def render(self, name, labels):
+        return [f'{name}_sum{labels} {self.sum}', f'{name}_count{labels} {self.count}']
+
+class Counter(_Metric):
+    """Monotonically increasing value; use rate() on it for per-second figures."""
+    TYPE = 'counter'
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1.0):
+        self._children[()].inc(amount)
+
+    def set_function(self, function):
+        self._children[()].set_function(function)
+
+class Gauge(_Metric):
+    """Value that can go up and down, or be computed at scrape time."""
+    TYPE = 'gauge'
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1.0):
+        self._children[()].inc(amount)
+
+    def dec(self, amount=1.0):
+        self._children[()].dec(amount)
+
+    def set(self, value):
+        self._children[()].set(value)
+
+    def set_function(self, function):
+        self._children[()].set_function(function)
+
+class Summary(_Metric):
+    """Running sum and count of observations, e.g. durations in seconds."""
+    TYPE = 'summary'
+
+    def _new_child(self):
+        return _SummaryValue()
+
+    def observe(self, value):
+        self._children[()].observe(value)
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = []
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = Registry()
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # scrapes are too frequent to print
+
+def start_metrics_server(host='127.0.0.1', port=9100, registry=REGISTRY):
+    """Serve the registry at http://host:port/metrics from a daemon thread."""
+    handler = type('MetricsHandler', (_MetricsHandler,), {'registry': registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,159 @@
+# Sits between the protocol and MotorController: coalesces bursts of PWM
+# commands to the latest one, skips redundant motor updates, limits how fast
+# the duty cycles may change and stops the car when commands stop arriving.
+
+import threading
+import time
+
+class MotorArbiter(threading.Thread):
+    """
+    Applies PWM commands to a MotorController from a single thread.
+
+    submit() only records the newest command and wakes the thread, so the
+    caller never touches GPIO. The thread moves the applied duty cycles
+    toward the target by at most slew_up / slew_down (duty fraction per
+    second, None for unlimited) and calls the motor only when the result
+    differs from what is already applied. If no command arrives within
+    watchdog_timeout seconds the motors are stopped until the next one.
+    """
+
+    EPSILON = 1e-4
+
+    def __init__(self, motor, slew_up=0.5, slew_down=None, watchdog_timeout=0.5, tick_rate=50.0):
+        super().__init__(daemon=True)
+        self.motor = motor
+        self.slew_up = slew_up
+        self.slew_down = slew_down
+        self.watchdog_timeout = watchdog_timeout
+        self.tick = 1.0 / tick_rate
+
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._running = True
+        self._pending = None          # latest unapplied (left, right, lf, rf)
+        self._target = (0.0, 0.0, 0, 0)
+        self._applied = (0.0, 0.0, 0, 0)
+        self._last_command = None     # monotonic time of the last submit, None when disarmed
+        self.tripped = False
+
+        self.received = 0
+        self.coalesced = 0
+        self.motor_updates = 0
+        self.watchdog_trips = 0
+
+    def submit(self, pwm):
+        """Record a PWM message (see Protocol.CMDS['PWM']) as the newest target."""
+        cmd = (float(pwm.get('left_duty', 0.0)), float(pwm.get('right_duty', 0.0)),
+               pwm.get('left_freq', 50), pwm.get('right_freq', 50))
+        with self._lock:
+            if self._pending is not None:
+                self.coalesced += 1
+            self._pending = cmd
+            self._last_command = time.monotonic()
+            self.received += 1
+        self._wake.set()
+
+    def halt(self):
+        """Stop the motors now and disarm the watchdog until the next command."""
+        with self._lock:
+            self._pending = None
+            self._target = (0.0, 0.0, 0, 0)
+            self._last_command = None
+        self._wake.set()
+
+    def stop(self):
+        self._running = False
+        self._wake.set()
+
+    def stats(self):
+        return {
+            "received": self.received,
+            "coalesced": self.coalesced,
+            "motor_updates": self.motor_updates,
+            "watchdog_trips": self.watchdog_trips,
+            "tripped": self.tripped,
+        }
+
+    def run(self):
+        last = time.monotonic()
+        while self._running:
+            self._wake.wait(self.tick)
+            self._wake.clear()
+            now = time.monotonic()
+            dt = now - last
+            last = now
+
+            with self._lock:
+                if self._pending is not None:
+                    self._target = self._pending
+                    self._pending = None
+                    if self.tripped:
+                        print("[ARBITER] Commands resumed")
+                        self.tripped = False
+                elif (self._last_command is not None and not self.tripped
+                      and now - self._last_command > self.watchdog_timeout):
+                    self.tripped = True
+                    self.watchdog_trips += 1
+                    self._target = (0.0, 0.0, 0, 0)
+                    print(f"[ARBITER] No command for {self.watchdog_timeout:.2f}s, stopping motors")
+                target = self._target
+
+            if self.tripped or (target[0] == 0.0 and target[1] == 0.0):
+                # Stopping is never slew limited
+                self._apply((0.0, 0.0, 0, 0))
+                continue
+
+            left = self._slew(self._applied[0], target[0], dt)
+            right = self._slew(self._applied[1], target[1], dt)
+            self._apply((left, right, target[2], target[3]))
+
+        self._apply((0.0, 0.0, 0, 0))
+
+    def _slew(self, current, target, dt):
+        limit = self.slew_up if abs(target) > abs(current) else self.slew_down
+        if limit is None:
+            return target
+        step = limit * dt
+        if target > current:
+            return min(target, current + step)
+        return max(target, current - step)
+
+    def _apply(self, cmd):
+        left, right, lf, rf = cmd
+        a_left, a_right, a_lf, a_rf = self._applied
+        if (abs(left - a_left) < self.EPSILON and abs(right - a_right) < self.EPSILON
+                and lf == a_lf and rf == a_rf):
+            return
+        if left == 0.0 and right == 0.0:
+            self.motor.stop()
+            print("[ARBITER] Motors stopped")
+        else:
+            self.motor.move_forward(left_duty=left, right_duty=right, left_freq=lf, right_freq=rf)
+        self._applied = cmd
+        self.motor_updates += 1
+
+def _gpio_check(commands=200):
+    """
+    Drive a MotorController backed by FakeGPIO with a burst of identical
+    commands, then go silent, and print direction-pin writes, motor updates
+    and watchdog trips. Requires CAR_FAKE_HW=1.
+    """
+    from car import MotorController, GPIO
+    motor = MotorController()
+    arbiter = MotorArbiter(motor, watchdog_timeout=0.2)
+    arbiter.start()
+    direction_pins = (motor.in1, motor.in2, motor.in3, motor.in4)
+    GPIO.reset_counts()
+    for _ in range(commands):
+        arbiter.submit({"left_duty": 0.07, "right_duty": 0.05, "left_freq": 30, "right_freq": 30})
+        time.sleep(0.002)
+    time.sleep(0.5)
+    print(f"{commands} commands -> {arbiter.motor_updates} motor updates, "
+          f"{GPIO.writes(direction_pins)} direction pin writes, "
+          f"{arbiter.watchdog_trips} watchdog trips, {arbiter.coalesced} coalesced")
+    arbiter.stop()
+    arbiter.join()
+    motor.cleanup()
+
+if __name__ == "__main__":
+    _gpio_check()
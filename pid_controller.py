@@ -3,7 +3,7 @@
 # The PID controller is used to adjust the car's speed and direction based on the detected lane.
 # It also includes methods for determining the PWM frequency based on the duty cycle.
 
-import cv2
+from lane_tracker import moments_centroid
 
 class PID:
     """PID controller for computing error, output, and debug data."""
@@ -11,9 +11,14 @@ class PID:
     Ki = 0.0010
     Kd = 0.03
     
-    def __init__(self):
+    def __init__(self, tracker=None, predictor=None):
         self.prev_error = 0.0
         self.integral = 0.0
+        self.tracker = tracker          # optional LaneTracker; None uses whole-image moments
+        self.predictor = predictor      # optional LatencyPredictor applied to the error
+        self.lane_confidence = 1.0
+        self.lane_lost = False
+        self.measured_error = 0.0       # error before latency compensation
     
     def compute(self, error):
         """
@@ -27,17 +32,23 @@ class PID:
         self.prev_error = error
         return output, derivative, self.integral, prev
     
-    def process(self, warped):
+    def process(self, warped, timestamp=None):
         """
         Process warped image to compute centroid, error, PID output,
         motor duty cycles, frequencies, and debug data.
+        timestamp is when the frame arrived (time.monotonic), used by the predictor.
         Returns:
           error, pid_output, left, right, lf, rf, derivative, integral, prev_error.
         """
         h, w = warped.shape
-        M = cv2.moments(warped)
-        cx = int(M["m10"] / M["m00"]) if M["m00"] != 0 else w // 2
+        cx = self.centroid(warped)
         error = (cx - w / 2) / (w / 2)
+        self.measured_error = error
+        if self.predictor is not None:
+            if self.lane_lost:
+                error = self.predictor.coast(timestamp)
+            else:
+                error = self.predictor.update(error, timestamp)
         pid_output, derivative, integral, prev_error = self.compute(error)
         base = 0.07
         left = base + pid_output
@@ -50,6 +61,14 @@ class PID:
         rf = self.determine_freq(right)
         return error, pid_output, left, right, lf, rf, derivative, integral, prev_error
     
+    def centroid(self, warped):
+        """Lane x position in the warped mask, falling back to the image centre when lost."""
+        if self.tracker is None:
+            return moments_centroid(warped)
+        cx, self.lane_confidence = self.tracker.locate(warped)
+        self.lane_lost = cx is None
+        return cx if cx is not None else warped.shape[1] // 2
+
     @staticmethod
     def determine_freq(duty):
         """Determine PWM frequency from duty cycle."""
@@ -70,3 +89,7 @@ class PID:
         """Reset PID state."""
         self.prev_error = 0.0
         self.integral = 0.0
+        if self.tracker is not None:
+            self.tracker.reset()
+        if self.predictor is not None:
+            self.predictor.reset()
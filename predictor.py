@@ -0,0 +1,130 @@
+# Latency compensation for the PID controller.
+# A constant-velocity Kalman filter tracks the lane error and its rate of
+# change, and projects the error forward by the measured frame-to-command
+# latency so the PID acts on where the lane will be, not where it was.
+
+import math
+import time
+
+class LatencyPredictor:
+    """
+    Two-state (error, error rate) Kalman filter with white-noise acceleration.
+
+    update() folds in a new measurement and returns the error projected
+    latency seconds ahead. coast() does the same without a measurement for
+    frames where the lane was not found. Measurements older than the last
+    one are ignored, and after a gap longer than max_gap the filter restarts
+    from the next measurement instead of extrapolating stale velocity.
+    """
+
+    def __init__(self, process_noise=2.0, measurement_noise=0.004, latency=0.08,
+                 latency_alpha=0.1, max_gap=0.5, max_rate=5.0):
+        self.q = process_noise          # acceleration noise spectral density
+        self.r = measurement_noise      # measurement variance of the error
+        self.latency = latency          # seconds to project forward
+        self.latency_alpha = latency_alpha
+        self.max_gap = max_gap
+        self.max_rate = max_rate        # clamp on the estimated error rate, per second
+        self.reset()
+
+    def reset(self):
+        self.x = [0.0, 0.0]
+        self.P = [[1.0, 0.0], [0.0, 1.0]]
+        self.t = None
+        self.late = 0
+        self.coasted = 0
+
+    def observe_latency(self, seconds):
+        """Blend a new frame-to-command latency sample into the running estimate."""
+        self.latency += self.latency_alpha * (seconds - self.latency)
+
+    def _predict(self, dt):
+        e, v = self.x
+        self.x = [e + v * dt, v]
+        (p00, p01), (p10, p11) = self.P
+        q = self.q
+        dt2 = dt * dt
+        self.P = [
+            [p00 + dt * (p10 + p01) + dt2 * p11 + q * dt2 * dt / 3, p01 + dt * p11 + q * dt2 / 2],
+            [p10 + dt * p11 + q * dt2 / 2, p11 + q * dt],
+        ]
+
+    def _correct(self, z):
+        (p00, p01), (p10, p11) = self.P
+        s = p00 + self.r
+        k0, k1 = p00 / s, p10 / s
+        y = z - self.x[0]
+        self.x = [self.x[0] + k0 * y, self.x[1] + k1 * y]
+        self.P = [
+            [(1 - k0) * p00, (1 - k0) * p01],
+            [p10 - k1 * p00, p11 - k1 * p01],
+        ]
+
+    def _projected(self):
+        rate = max(-self.max_rate, min(self.x[1], self.max_rate))
+        return max(-1.0, min(self.x[0] + rate * self.latency, 1.0))
+
+    def update(self, error, timestamp=None):
+        """Fold in a measured error taken at timestamp (monotonic seconds)."""
+        if timestamp is None:
+            timestamp = time.monotonic()
+        if self.t is not None and timestamp <= self.t:
+            self.late += 1
+            return self._projected()
+        if self.t is None or timestamp - self.t > self.max_gap:
+            self.reset()
+            self.x = [error, 0.0]
+            self.P = [[self.r, 0.0], [0.0, 1.0]]
+        else:
+            self._predict(timestamp - self.t)
+            self._correct(error)
+        self.t = timestamp
+        return self._projected()
+
+    def coast(self, timestamp=None):
+        """Advance without a measurement; returns the projected error."""
+        if self.t is None:
+            return 0.0
+        if timestamp is None:
+            timestamp = time.monotonic()
+        if timestamp - self.t > self.max_gap:
+            # Too long without a lane to trust the velocity any more
+            self.x[1] = 0.0
+        elif timestamp > self.t:
+            self._predict(timestamp - self.t)
+            self.t = timestamp
+        self.coasted += 1
+        return self._projected()
+
+def _synthetic_check(delay=0.12, rate=20.0, seconds=20.0, drop_every=7, noise=0.02):
+    """
+    Feed a delayed, noisy sinusoidal error sequence with dropped frames and
+    compare how well the raw delayed measurement and the prediction match
+    the true error at the time the command would take effect.
+    """
+    import random
+    rng = random.Random(0)
+    predictor = LatencyPredictor(latency=delay)
+    dt = 1.0 / rate
+    raw_err = pred_err = 0.0
+    measured = 0.0
+    n = 0
+    for i in range(int(seconds * rate)):
+        t = i * dt
+        truth_now = 0.6 * math.sin(1.3 * t)
+        truth_later = 0.6 * math.sin(1.3 * (t + delay))
+        if drop_every and i % drop_every == 0:
+            predicted = predictor.coast(t)  # frame lost; raw control keeps the last measurement
+        else:
+            measured = truth_now + rng.gauss(0.0, noise)
+            predicted = predictor.update(measured, t)
+        if i > rate:  # skip filter start-up
+            raw_err += abs(measured - truth_later)
+            pred_err += abs(predicted - truth_later)
+            n += 1
+    print(f"delay {delay * 1000:.0f} ms: raw mean error {raw_err / n:.4f}, "
+          f"predicted mean error {pred_err / n:.4f}")
+
+if __name__ == "__main__":
+    for delay in (0.05, 0.12, 0.25):
+        _synthetic_check(delay=delay)
@@ -1,19 +1,72 @@
 import socket
 import struct
+import threading
+import collections
 import json
 import numpy as np
 from typing import Optional
 from Crypto.PublicKey import RSA
-from Crypto.Cipher import PKCS1_OAEP, AES
+from Crypto.Cipher import PKCS1_OAEP
 from Crypto import Random
 import cv2
 import base64
+from session_crypto import SessionCrypto, SUITES, DEFAULT_SUITE, negotiate
+from frame_sender import FrameSender
+import tcp_video
+from tcp_video import VideoFrame, CODEC_JPEG
 
 MAX_CLIENTS = 1  # Adjustable as needed
+# First plaintext byte of a UDP frame resent from the car's history (JPEG data starts with 0xFF)
+RECORDED_MARK = b'R'
 
 class ConnectionClosedError(Exception):
     pass
 
+class RSAKeyPool:
+    """
+    Keeps a few freshly generated RSA keys ready so clients do not wait on
+    keygen during the handshake. Every key is handed out once; one background
+    thread does all the generating, so a handshake on an empty pool waits for
+    that thread instead of starting a second keygen next to it.
+    """
+
+    def __init__(self, size=2, bits=2048):
+        self.size = size
+        self.bits = bits
+        self._keys = collections.deque()
+        self._cond = threading.Condition()
+        self._refill = threading.Event()
+
+    def fill(self):
+        """Generate keys until the pool is full."""
+        while True:
+            with self._cond:
+                if len(self._keys) >= self.size:
+                    return
+            key = RSA.generate(self.bits)
+            with self._cond:
+                self._keys.append(key)
+                self._cond.notify()
+
+    def start(self):
+        """Start the background thread and fill the pool straight away."""
+        self._refill.set()
+        threading.Thread(target=self._refill_loop, name="rsa-keys", daemon=True).start()
+
+    def _refill_loop(self):
+        while True:
+            self._refill.wait()
+            self._refill.clear()
+            self.fill()
+
+    def get(self):
+        self._refill.set()
+        with self._cond:
+            self._cond.wait_for(lambda: self._keys)
+            key = self._keys.popleft()
+        self._refill.set()
+        return key
+
 class Protocol:
     CMDS = {
         'RSAKEY': 'rsakey',
@@ -21,16 +74,30 @@ class Protocol:
         'SIGNUP': 'signup',
         'LOGIN': 'login',
         'PWM': 'pwm',
-        'UDP_PORT': 'udp_port'
+        'UDP_PORT': 'udp_port',
+        'STATUS': 'status',
+        'VIDEO_MODE': 'video_mode',
+        'VIEWPORT': 'viewport',
+        'REPLAY': 'replay',
+        'PROFILE': 'profile'
     }
 
     # JSON Message Structures:
-    # - 'RSAKEY': {"type": "rsakey", "public_key": str (base64)}
-    # - 'AESKEY': {"type": "aeskey", "encrypted_aes_key": str (base64)}
+    # - 'RSAKEY': {"type": "rsakey", "public_key": str (base64), "suites": [str, ...]}
+    # - 'AESKEY': {"type": "aeskey", "encrypted_aes_key": str (base64), "suite": str}
     # - 'SIGNUP': {"type": "signup", "username": str, "password": str, "age": int}
     # - 'LOGIN': {"type": "login", "username": str, "password": str}
     # - 'PWM': {"type": "pwm", "left_duty": float, "right_duty": float, "left_freq": int, "right_freq": int}
-    # - 'UDP_PORT': {"type": "udp_port", "port": int}
+    # - 'UDP_PORT': {"type": "udp_port", "port": int, "viewport": [width, height] (optional)}
+    # - 'STATUS': {"type": "status", "state": "warming_up" | "ready"}
+    # - 'VIDEO_MODE': {"type": "video_mode", "mode": "udp" | "tcp"}
+    # - 'VIEWPORT': {"type": "viewport", "width": int, "height": int}
+    # - 'REPLAY': request {"type": "replay", "seconds": float, "speed": float}
+    #             reply   {"type": "replay", "status": "started" | "done" | "unavailable", ...}
+    # - 'PROFILE': admin request {"type": "profile", "action": "start" | "stop", "rate": int (optional)}
+    #              reply {"type": "profile", "status": "started" | "stopped" | "not_running" | "rejected",
+    #                     "stats": {...}, "collapsed": str (collapsed stacks, on stop)}
+    # Video frames on TCP use the same framing with a binary header, see tcp_video.
 
     def __init__(self, role: str, host: Optional[str] = None, port: Optional[int] = None,
                  listen_sock: Optional[socket.socket] = None):
@@ -47,6 +114,10 @@ class Protocol:
                 self.sock.listen(MAX_CLIENTS)
         self.conn = None
         self.aes_key = None
+        self.crypto = None  # SessionCrypto, set by key_exchange
+        self.send_lock = threading.Lock()  # send_json may be called from several threads
+        self.frame_sender = None
+        self.frame_lock = threading.Lock()  # live frames and replays may share frame_sender
 
     def connect(self):
         if self.role == 'client':
@@ -72,15 +143,20 @@ class Protocol:
         data = self._recv_exact(sock, length)
         return json.loads(data.decode())
 
-    def key_exchange(self):
+    def key_exchange(self, rsa_key=None):
         if self.role == 'server':
-            rsa_key = RSA.generate(2048)
+            if rsa_key is None:
+                rsa_key = RSA.generate(2048)
             pub_key = rsa_key.publickey().exportKey()
             pub_key_b64 = base64.b64encode(pub_key).decode()
-            self.send_unencrypted_json({"type": self.CMDS['RSAKEY'], "public_key": pub_key_b64})
+            self.send_unencrypted_json({"type": self.CMDS['RSAKEY'], "public_key": pub_key_b64,
+                                        "suites": list(SUITES)})
             response = self.recv_unencrypted_json()
             if response.get("type") != self.CMDS['AESKEY']:
                 raise ValueError("Invalid AESKEY response")
+            suite = response.get("suite", DEFAULT_SUITE)
+            if suite not in SUITES:
+                raise ValueError(f"Unsupported cipher suite: {suite}")
             encrypted_aes_key = base64.b64decode(response.get("encrypted_aes_key"))
             cipher = PKCS1_OAEP.new(rsa_key)
             self.aes_key = cipher.decrypt(encrypted_aes_key)
@@ -93,74 +169,159 @@ class Protocol:
             self.aes_key = Random.new().read(32)
             encrypted_aes_key = cipher.encrypt(self.aes_key)
             encrypted_aes_key_b64 = base64.b64encode(encrypted_aes_key).decode()
-            self.send_unencrypted_json({"type": self.CMDS['AESKEY'], "encrypted_aes_key": encrypted_aes_key_b64})
+            suite = negotiate(init_msg.get("suites"))
+            self.send_unencrypted_json({"type": self.CMDS['AESKEY'], "encrypted_aes_key": encrypted_aes_key_b64,
+                                        "suite": suite})
+        self.crypto = SessionCrypto(self.aes_key, suite, self.role)
+        self.frame_sender = FrameSender(self.crypto.udp_send)
 
     def send_json(self, msg: dict):
         data = json.dumps(msg).encode()
-        cipher = AES.new(self.aes_key, AES.MODE_GCM)
-        ct, tag = cipher.encrypt_and_digest(data)
-        to_send = cipher.nonce + tag + ct
-        length = struct.pack('I', len(to_send))
-        if self.role == 'server':
-            self.conn.sendall(length + to_send)
-        else:
-            self.sock.sendall(length + to_send)
+        sock = self.conn if self.role == 'server' else self.sock
+        with self.send_lock:
+            to_send = self.crypto.tcp_send.seal(data)
+            length = struct.pack('I', len(to_send))
+            sock.sendall(length + to_send)
 
-    def recv_json(self) -> dict:
+    def _recv_sealed(self) -> bytes:
         sock = self.conn if self.role == 'server' else self.sock
         length = struct.unpack('I', self._recv_exact(sock, 4))[0]
         data = self._recv_exact(sock, length)
-        nonce, tag, ct = data[:16], data[16:32], data[32:]
-        cipher = AES.new(self.aes_key, AES.MODE_GCM, nonce=nonce)
-        pt = cipher.decrypt_and_verify(ct, tag)
+        return self.crypto.tcp_recv.open(data)
+
+    def recv_json(self) -> dict:
+        pt = self._recv_sealed()
+        if tcp_video.is_video(pt):
+            raise ValueError("Unexpected video frame on the TCP stream")
         return json.loads(pt.decode())
 
-    def recv_frame(self) -> np.ndarray:
+    def recv_message(self):
+        """
+        Receive the next TCP message: a dict for JSON, or a VideoFrame once
+        the server streams video over TCP.
+        """
+        pt = self._recv_sealed()
+        if tcp_video.is_video(pt):
+            return tcp_video.parse(pt)
+        return json.loads(pt.decode())
+
+    def send_video_frame(self, payload, frame_id: int, timestamp: float, shape: tuple,
+                         codec: int = CODEC_JPEG, recorded: bool = False) -> int:
+        """
+        Send an encoded frame on the TCP stream with its self-describing header.
+
+        :param payload: Bytes-like encoded frame, e.g. from encode_frame.
+        :param frame_id: Sequence number of the frame.
+        :param timestamp: Capture time (time.time()).
+        :param shape: Shape of the decoded frame.
+        :param codec: tcp_video.CODEC_JPEG or CODEC_RAW.
+        :param recorded: True for frames resent from history rather than live.
+        :return: Number of bytes sent.
+        """
+        data = tcp_video.pack_header(frame_id, timestamp, shape, codec, recorded) + bytes(payload)
         sock = self.conn if self.role == 'server' else self.sock
-        length = struct.unpack('I', self._recv_exact(sock, 4))[0]
-        data = self._recv_exact(sock, length)
-        nonce, tag, ct = data[:16], data[16:32], data[32:]
-        cipher = AES.new(self.aes_key, AES.MODE_GCM, nonce=nonce)
-        pt = cipher.decrypt_and_verify(ct, tag)
-        return np.frombuffer(pt, dtype=np.uint8).reshape((380, 640, 3))
+        with self.send_lock:
+            to_send = self.crypto.tcp_send.seal(data)
+            sock.sendall(struct.pack('I', len(to_send)) + to_send)
+        return 4 + len(to_send)
 
-    def send_frame_udp(self, frame: np.ndarray, udp_addr: tuple, udp_socket: socket.socket):
+    def recv_frame(self) -> np.ndarray:
         """
-        Encode the frame to JPEG, encrypt it with AES-GCM, and send it over UDP to the specified address.
-        
+        Receive one video frame from the TCP stream and decode it.
+
+        :return: Decoded frame with the shape given in its header.
+        """
+        msg = self.recv_message()
+        if not isinstance(msg, VideoFrame):
+            raise ValueError("Expected a video frame")
+        return tcp_video.decode(msg)
+
+    @staticmethod
+    def encode_frame(frame: np.ndarray) -> memoryview:
+        """
+        Encode the frame to JPEG once so the result can be sent to every client.
+
         :param frame: Numpy array representing the frame.
-        :param udp_addr: Tuple (host, port) to send the frame to.
-        :param udp_socket: UDP socket to use for sending.
+        :return: Flat byte view of the JPEG data.
         """
         ret, encoded = cv2.imencode(".jpg", frame)
         if not ret:
             raise ValueError("Failed to encode frame to JPEG")
-        data = encoded.tobytes()
-        cipher = AES.new(self.aes_key, AES.MODE_GCM)
-        ct, tag = cipher.encrypt_and_digest(data)
-        to_send = cipher.nonce + tag + ct
-        length = struct.pack('I', len(to_send))
-        udp_socket.sendto(length + to_send, udp_addr)
+        return memoryview(encoded.reshape(-1))
 
-    def recv_frame_udp(self, udp_socket: socket.socket) -> np.ndarray:
+    def send_encoded_frame_udp(self, payload, udp_addr: tuple, udp_socket: socket.socket):
+        """
+        Encrypt an already encoded frame into preallocated buffers and send it
+        over UDP with scatter-gather I/O, without copying the payload.
+
+        :param payload: Bytes-like JPEG data, e.g. from encode_frame.
+        :param udp_addr: Tuple (host, port) to send the frame to.
+        :param udp_socket: UDP socket to use for sending.
+        :return: Number of bytes sent.
         """
-        Receive an AES-GCM encrypted JPEG-encoded frame from the UDP socket, decrypt it, and decode it.
+        with self.frame_lock:
+            return self.frame_sender.send(payload, udp_addr, udp_socket)
+
+    def send_frame_udp(self, frame: np.ndarray, udp_addr: tuple, udp_socket: socket.socket):
+        """
+        Encode the frame to JPEG, encrypt it with the session cipher, and send it over UDP to the specified address.
         
+        :param frame: Numpy array representing the frame.
+        :param udp_addr: Tuple (host, port) to send the frame to.
+        :param udp_socket: UDP socket to use for sending.
+        """
+        self.send_encoded_frame_udp(self.encode_frame(frame), udp_addr, udp_socket)
+
+    @staticmethod
+    def mark_recorded(payload) -> bytes:
+        """UDP payload for a frame resent from history, so clients never mistake it for a live one."""
+        return RECORDED_MARK + bytes(payload)
+
+    def recv_video_udp(self, udp_socket: socket.socket) -> tuple:
+        """
+        Receive and decrypt one frame datagram without decoding it.
+
         :param udp_socket: UDP socket to receive from.
-        :return: Decoded frame as a numpy array.
+        :return: (JPEG bytes, recorded); recorded is True for frames resent
+                 from the car's history. Keep-alives are empty bytes.
         """
         data, _ = udp_socket.recvfrom(65535)  # Assuming max UDP packet size
         length = struct.unpack('I', data[:4])[0]
-        data = data[4:4+length]
-        nonce, tag, ct = data[:16], data[16:32], data[32:]
-        cipher = AES.new(self.aes_key, AES.MODE_GCM, nonce=nonce)
-        pt = cipher.decrypt_and_verify(ct, tag)
-        buf = np.frombuffer(pt, np.uint8)
-        frame = cv2.imdecode(buf, cv2.IMREAD_COLOR)
+        pt = self.crypto.udp_recv.open(data[4:4+length])
+        if pt[:1] == RECORDED_MARK:
+            return pt[1:], True
+        return pt, False
+
+    def recv_jpeg_udp(self, udp_socket: socket.socket) -> bytes:
+        """
+        Receive and decrypt one frame datagram without decoding it.
+
+        :param udp_socket: UDP socket to receive from.
+        :return: JPEG bytes.
+        """
+        return self.recv_video_udp(udp_socket)[0]
+
+    @staticmethod
+    def decode_jpeg(pt) -> np.ndarray:
+        frame = cv2.imdecode(np.frombuffer(pt, np.uint8), cv2.IMREAD_COLOR)
         if frame is None:
             raise ValueError("Failed to decode frame from JPEG")
         return frame
 
+    def recv_frame_udp(self, udp_socket: socket.socket) -> np.ndarray:
+        """
+        Receive an encrypted JPEG-encoded frame from the UDP socket, decrypt it, and decode it.
+        Raises ReplayError for datagrams older than the last one accepted.
+        
+        :param udp_socket: UDP socket to receive from.
+        :return: Decoded frame as a numpy array, or None for a keep-alive
+                 (the server sends those instead of unchanged frames).
+        """
+        pt = self.recv_jpeg_udp(udp_socket)
+        if not pt:
+            return None
+        return self.decode_jpeg(pt)
+
     def _recv_exact(self, sock: socket.socket, n: int) -> bytes:
         data = b''
         while len(data) < n:
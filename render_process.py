@@ -0,0 +1,249 @@
+# Runs the Tk GUI in a separate process so resizing, colour conversion and
+# PhotoImage creation never compete with the control loop for the GIL.
+#
+# The control process writes each frame's panels into a multiprocessing
+# shared_memory ring and never waits on the GUI; the GUI process polls the
+# ring for the newest complete slot. A duplex pipe carries button presses
+# (stop / continue / reset) back and info text forward.
+
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import numpy as np
+
+PANELS       = ("orig", "mask", "warped")
+MAX_PANEL    = 640 * 480 * 3            # bytes per panel per slot
+INFO_BYTES   = 512
+POLL_MS      = 10
+
+SLOT_HEADER = np.dtype([
+    ("seq", "<u8"),                     # 0 while the slot is being written
+    ("shapes", "<u4", (len(PANELS), 3)),
+    ("error", "<f8"),
+    ("pid", "<f8"),
+    ("info", f"S{INFO_BYTES}"),
+])
+
+class FrameRing:
+    """
+    Fixed ring of frame slots in shared memory. One writer, any readers.
+    A reader copies the newest slot and discards the copy if the writer
+    reused the slot meanwhile.
+    """
+
+    def __init__(self, slots=3, name=None):
+        self.slots = slots
+        header_size = 8 + slots * SLOT_HEADER.itemsize
+        size = header_size + slots * len(PANELS) * MAX_PANEL
+        self.owner = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=size)
+        buf = self.shm.buf
+        self._latest = np.ndarray((1,), "<u8", buf, 0)
+        self._headers = np.ndarray((slots,), SLOT_HEADER, buf, 8)
+        self._data = np.ndarray((slots, len(PANELS), MAX_PANEL), np.uint8, buf, header_size)
+        if self.owner:
+            self._latest[0] = 0
+            self._headers["seq"] = 0
+        self._seq = int(self._latest[0])
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def write(self, panels, error=0.0, pid=0.0, info=""):
+        """Copy panels (arrays or None, in PANELS order) into the next slot. Never blocks."""
+        self._seq += 1
+        slot = self._seq % self.slots
+        header = self._headers[slot:slot + 1]
+        header["seq"] = 0
+        shapes = np.zeros((len(PANELS), 3), np.uint32)
+        for i, img in enumerate(panels):
+            if img is None:
+                continue
+            if img.nbytes > MAX_PANEL:
+                raise ValueError(f"{PANELS[i]} panel of {img.nbytes} bytes exceeds the ring slot")
+            self._data[slot, i, :img.nbytes] = img.reshape(-1)
+            shapes[i, :img.ndim] = img.shape
+        header["shapes"] = shapes
+        header["error"] = error
+        header["pid"] = pid
+        header["info"] = info.encode()[:INFO_BYTES]
+        header["seq"] = self._seq
+        self._latest[0] = self._seq
+
+    def read_latest(self, last_seq):
+        """Return (seq, panels, error, pid, info) for a slot newer than last_seq, or None."""
+        seq = int(self._latest[0])
+        if seq <= last_seq:
+            return None
+        slot = seq % self.slots
+        header = self._headers[slot].copy()
+        if int(header["seq"]) != seq:
+            return None
+        panels = []
+        for i in range(len(PANELS)):
+            shape = tuple(int(d) for d in header["shapes"][i] if d)
+            if not shape:
+                panels.append(None)
+                continue
+            n = int(np.prod(shape))
+            panels.append(self._data[slot, i, :n].copy().reshape(shape))
+        if int(self._headers[slot]["seq"]) != seq:
+            return None  # overwritten while copying
+        return seq, panels, float(header["error"]), float(header["pid"]), header["info"].decode(errors="replace")
+
+    def close(self):
+        # Drop numpy views before closing the mapping
+        self._latest = self._headers = self._data = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+class _NotifyingFlags(dict):
+    """control_flags for the GUI process: every change is forwarded over the pipe."""
+
+    def __init__(self, conn, initial):
+        super().__init__(initial)
+        self._conn = conn
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self._conn.send(("flag", key, value))
+
+class _PipePID:
+    def __init__(self, conn):
+        self._conn = conn
+
+    def reset(self):
+        self._conn.send(("reset",))
+
+class _PipeServer:
+    """Stands in for the Client object the GUI buttons and resize handler talk to."""
+
+    def __init__(self, conn):
+        self.pid = _PipePID(conn)
+        self._conn = conn
+
+    def send_viewport(self, width, height):
+        self._conn.send(("viewport", width, height))
+
+    def request_replay(self, seconds, speed):
+        self._conn.send(("replay", seconds, speed))
+
+def _gui_main(ring_name, slots, conn, is_admin, car_ip):
+    import cv2
+    if is_admin:
+        from admin_gui import AdminGUI
+        gui = AdminGUI()
+    else:
+        from spec_gui import SpectatorGUI
+        gui = SpectatorGUI()
+    ring = FrameRing(slots, name=ring_name)
+    gui.control_flags = _NotifyingFlags(conn, gui.control_flags)
+    gui.server = _PipeServer(conn)
+    gui.set_car_ip(car_ip)
+    state = {"seq": 0}
+
+    def poll():
+        while conn.poll():
+            msg = conn.recv()
+            if msg[0] == "info":
+                gui.info.set(msg[1])
+        latest = ring.read_latest(state["seq"])
+        if latest is not None:
+            state["seq"], (orig, mask, warped), error, pid, info = latest
+            if is_admin and mask is not None:
+                mask_bgr = cv2.cvtColor(mask, cv2.COLOR_GRAY2BGR) if mask.ndim == 2 else mask
+                warped_bgr = cv2.cvtColor(warped, cv2.COLOR_GRAY2BGR) if warped.ndim == 2 else warped
+                gui.update_gui(orig, mask_bgr, warped_bgr, gui.pid_graph.update(error, pid), info)
+            elif orig is not None:
+                gui.update_gui(orig, None, None, None, info)
+        gui.after(POLL_MS, poll)
+
+    gui.after(POLL_MS, poll)
+    try:
+        gui.mainloop()
+    finally:
+        conn.send(("closed",))
+        ring.close()
+
+class _PIDValues:
+    """pid_graph stand-in on the control side: keeps the values, draws nothing."""
+
+    def __init__(self):
+        self.error = 0.0
+        self.pid = 0.0
+
+    def update(self, error, pid_output):
+        self.error = error
+        self.pid = pid_output
+        return None
+
+class _InfoProxy:
+    def __init__(self, conn):
+        self._conn = conn
+
+    def set(self, text):
+        self._conn.send(("info", text))
+
+class RemoteGUI:
+    """
+    Control-process handle for a GUI running in its own process. It has the
+    attributes Client.run uses (is_admin, control_flags, pid_graph, info,
+    update_gui) and mainloop() services the control pipe until the window
+    closes. Call close() after the control loop has stopped.
+    """
+    wants_raw_masks = True  # mask/warped are sent single-channel; the GUI process converts
+
+    def __init__(self, is_admin, slots=3):
+        self.is_admin = is_admin
+        self.control_flags = {"stopped": False}
+        self.pid_graph = _PIDValues()
+        self.server = None
+        self.car_ip = ""
+        self._ring = FrameRing(slots)
+        self._conn, self._child_conn = mp.Pipe()
+        self.info = _InfoProxy(self._conn)
+        self._process = None
+        self.frames_written = 0
+
+    def set_car_ip(self, ip):
+        self.car_ip = ip
+
+    def viewport(self):
+        return None  # the GUI process reports its size once the window is shown
+
+    def update_gui(self, orig_img, mask_img, warped_img, pid_img, info_str):
+        self._ring.write((orig_img, mask_img, warped_img),
+                         self.pid_graph.error, self.pid_graph.pid, info_str)
+        self.frames_written += 1
+
+    def mainloop(self):
+        ctx = mp.get_context("spawn")  # never fork a process that has Tk or client threads
+        self._process = ctx.Process(
+            target=_gui_main,
+            args=(self._ring.name, self._ring.slots, self._child_conn, self.is_admin, self.car_ip),
+            daemon=True)
+        self._process.start()
+        try:
+            while self._process.is_alive():
+                if not self._conn.poll(0.1):
+                    continue
+                msg = self._conn.recv()
+                if msg[0] == "flag":
+                    self.control_flags[msg[1]] = msg[2]
+                elif msg[0] == "reset" and self.server is not None:
+                    self.server.pid.reset()
+                elif msg[0] == "viewport" and self.server is not None:
+                    self.server.send_viewport(msg[1], msg[2])
+                elif msg[0] == "replay" and self.server is not None:
+                    self.server.request_replay(msg[1], msg[2])
+                elif msg[0] == "closed":
+                    break
+        except (EOFError, KeyboardInterrupt):
+            pass
+        finally:
+            self._process.join(timeout=2)
+
+    def close(self):
+        """Release the shared memory; call once the control loop has stopped writing."""
+        self._ring.close()
@@ -0,0 +1,163 @@
+# On-demand sampling profiler.
+# A daemon thread wakes `rate` times a second, reads every other thread's
+# Python stack with sys._current_frames() and counts identical stacks. The
+# result is in collapsed-stack format (one "thread;outer;...;inner count"
+# line per stack), which flamegraph.pl, speedscope and inferno read directly.
+# Nothing runs and nothing is counted while the profiler is stopped.
+
+import collections
+import os
+import sys
+import threading
+import time
+
+DEFAULT_RATE = 100    # samples per second
+MAX_RATE     = 1000   # above this the sampler is close to a busy loop holding the GIL
+MAX_DEPTH    = 64     # innermost frames kept per stack
+
+class SamplingProfiler:
+    def __init__(self, rate=DEFAULT_RATE, max_depth=MAX_DEPTH):
+        self.rate = self._check_rate(rate)
+        self.max_depth = max_depth
+        self._stacks = collections.Counter()
+        self._labels = {}        # code object -> "function (file:line)"
+        self._names = {}         # thread ident -> thread name
+        self._stop = threading.Event()
+        self._thread = None
+        self.samples = 0
+        self.sample_seconds = 0.0
+        self.started = None
+        self.elapsed = 0.0
+
+    @staticmethod
+    def _check_rate(rate):
+        if not 0 < rate <= MAX_RATE:
+            raise ValueError(f"Sample rate must be between 0 and {MAX_RATE} Hz, got {rate}")
+        return rate
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self, rate=None):
+        if self.running:
+            return False
+        if rate is not None:
+            self.rate = self._check_rate(rate)
+        self._stacks.clear()
+        self.samples = 0
+        self.sample_seconds = 0.0
+        self._stop.clear()
+        self.started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="sampler", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        """Stop sampling and return the collapsed stacks (empty if not running)."""
+        if not self.running:
+            return ""
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.elapsed = time.perf_counter() - self.started
+        return self.collapsed()
+
+    def _label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            label = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+            self._labels[code] = label
+        return label
+
+    def _thread_name(self, ident):
+        name = self._names.get(ident)
+        if name is None:
+            self._names = {t.ident: t.name for t in threading.enumerate()}
+            name = self._names.get(ident, f"thread-{ident}")
+        return name
+
+    def _run(self):
+        interval = 1.0 / self.rate
+        own = threading.get_ident()
+        while not self._stop.wait(interval):
+            t0 = time.perf_counter()
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    stack.append(self._label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(self._thread_name(ident))
+                stack.reverse()
+                self._stacks[";".join(stack)] += 1
+            self.samples += 1
+            self.sample_seconds += time.perf_counter() - t0
+
+    def collapsed(self):
+        return "\n".join(f"{stack} {count}" for stack, count in sorted(self._stacks.items()))
+
+    def stats(self):
+        """
+        Samples taken, achieved rate, mean cost of one sample and the share
+        of one core spent sampling. The sampler needs the GIL to wake up, so
+        with busy Python threads the achieved rate falls below the target.
+        """
+        elapsed = (time.perf_counter() - self.started) if self.running else self.elapsed
+        return {
+            "samples": self.samples,
+            "rate": self.samples / elapsed if elapsed > 0 else 0.0,
+            "sample_ms": self.sample_seconds / self.samples * 1000 if self.samples else 0.0,
+            "overhead": self.sample_seconds / elapsed if elapsed > 0 else 0.0,
+        }
+
+def write_profile(collapsed, which, directory="."):
+    """Save collapsed stacks as profile-<which>-<time>.folded and return the path."""
+    path = os.path.join(directory, f"profile-{which}-{time.strftime('%Y%m%d-%H%M%S')}.folded")
+    with open(path, "w") as f:
+        f.write(collapsed + "\n")
+    return path
+
+def _overhead_check(seconds=3.0, threads=4, rates=(100, 1000)):
+    """
+    Throughput of a few busy Python threads without the profiler, with it
+    created but stopped, and sampling at each rate.
+    """
+    def work(stop, counts, i):
+        n = 0
+        while not stop.is_set():
+            sum(range(200))
+            n += 1
+        counts[i] = n
+
+    def run(profiler=None, rate=None):
+        stop = threading.Event()
+        counts = [0] * threads
+        workers = [threading.Thread(target=work, args=(stop, counts, i)) for i in range(threads)]
+        for w in workers:
+            w.start()
+        if profiler is not None and rate:
+            profiler.start(rate)
+        time.sleep(seconds)
+        stop.set()
+        for w in workers:
+            w.join()
+        if profiler is not None and profiler.running:
+            profiler.stop()
+        return sum(counts) / seconds
+
+    baseline = run()
+    print(f"no profiler     {baseline:10.0f} iterations/s")
+    idle = run(SamplingProfiler())
+    print(f"stopped         {idle:10.0f} iterations/s  ({idle / baseline - 1:+.1%})")
+    for rate in rates:
+        profiler = SamplingProfiler()
+        throughput = run(profiler, rate)
+        s = profiler.stats()
+        print(f"sampling {rate:4d} Hz {throughput:10.0f} iterations/s  ({throughput / baseline - 1:+.1%})  "
+              f"{s['rate']:.0f} samples/s, {s['sample_ms']:.3f} ms each, {s['overhead']:.1%} of a core, "
+              f"{len(profiler.collapsed().splitlines())} distinct stacks")
+
+if __name__ == "__main__":
+    _overhead_check()
@@ -1,26 +1,140 @@
+import os
 import socket
 import threading
 import time
 import cv2
 import numpy as np
-from picamera2 import Picamera2
 from car import MotorController
+from fake_hw import fake_hw_enabled, FakeCamera
+from motor_arbiter import MotorArbiter
 from sqldb import UserDB
-from protocol import Protocol, ConnectionClosedError
+from protocol import Protocol, ConnectionClosedError, RSAKeyPool
+from startup import StartupSequence
+from control_channel import ControlReceiver
+from frame_scheduler import FrameScheduler, ClientSendQueue
+from change_detector import ChangeDetector, IdleSavings
+from tcp_video import LatestFrameSender
+from encode_pool import ParallelEncoder
+import simulcast
+from frame_history import RecentFrames
+from sampler import SamplingProfiler
+from session_crypto import HEADER_SIZE
+from metrics import Counter, Gauge, Summary, start_metrics_server
 
-MAX_CLIENTS   = 3
 FRAME_RATE    = 20.0
+ENCODE_WORKERS = 3        # parallel JPEG encoder threads (0: encode inline on the frame thread)
+ENCODE_DEPTH   = 4        # frames in flight before the oldest is dropped
+# Priority classes for frame delivery, served in this order every frame.
+#   limit - clients admitted in the class (spectators: CAR_MAX_SPECTATORS
+#           overrides it, e.g. for load_test.py)
+#   queue - frames buffered per client before the oldest is dropped
+#   budget - fraction of the frame period after capture by which the class
+#            must be served; clients not reached in time skip this frame
+#            (None: always served)
+CLASS_POLICIES = {
+    'admin':     {'limit': 1, 'queue': 1, 'budget': None},
+    'spectator': {'limit': int(os.environ.get("CAR_MAX_SPECTATORS", 4)), 'queue': 2, 'budget': 0.8},
+}
+MAX_CLIENTS   = sum(policy['limit'] for policy in CLASS_POLICIES.values())
+STATS_INTERVAL = 30.0     # seconds between frame loop stats reports
 ADMIN_USER    = 'admin'
 ADMIN_PASS    = 'admin'
+METRICS_HOST  = '127.0.0.1'
+METRICS_PORT  = 9100
+CAMERA_SIZE   = (480, 270)
+UDP_CONTROL   = True      # offer the admin a UDP channel for PWM commands
+CAMERA_READY_TIMEOUT = 5.0   # seconds to wait for the first usable frame
+HISTORY_BYTES = 8 * 1024 * 1024   # preallocated arena for recent encoded frames
+REPLAY_MAX_SPEED = 8.0
+# Static scenes: spectators get a full frame only every STATIC_REFRESH seconds
+# and an empty encrypted keep-alive every KEEPALIVE_INTERVAL in between.
+# The admin always gets every frame. CHANGE_THRESHOLD is the fraction of
+# thumbnail pixels that must change (None turns suppression off).
+CHANGE_THRESHOLD   = 0.01
+STATIC_REFRESH     = 1.0
+KEEPALIVE_INTERVAL = 0.25
+KEEPALIVE          = memoryview(b'')
+KEEPALIVE_BYTES    = 4 + HEADER_SIZE
+
+FRAMES_CAPTURED  = Counter('car_frames_captured_total', 'Frames captured from the camera')
+FRAMES_SKIPPED   = Counter('car_frame_slots_skipped_total', 'Frame slots skipped because the loop overran')
+CAPTURE_FPS      = Gauge('car_capture_fps', 'Smoothed camera capture rate')
+CAPTURE_SECONDS  = Summary('car_frame_capture_seconds', 'Camera capture and conversion time per frame')
+ENCODE_SECONDS   = Summary('car_frame_encode_seconds', 'JPEG encode time per frame')
+ENCRYPT_SECONDS  = Summary('car_frame_encrypt_seconds', 'Encrypt time per frame per client')
+SEND_SECONDS     = Summary('car_frame_send_seconds', 'UDP send time per frame per client')
+CLIENT_BYTES     = Counter('car_client_bytes_sent_total', 'Frame bytes sent per client, UDP or TCP video', ['client'])
+CLIENT_DROPS     = Counter('car_client_frames_dropped_total', 'Frames dropped from a client send queue', ['client'])
+CLIENT_PUSHBACK  = Counter('car_client_backpressure_total', 'Sends that would have blocked per client', ['client'])
+CLIENT_SKIPPED   = Counter('car_client_frames_skipped_total', 'Frames skipped because the frame budget ran out', ['client'])
+ADMIN_SEND_SECONDS = Summary('car_admin_send_seconds', 'Time from encoded frame to admin send, by spectator count',
+                             ['spectators'])
+SPECTATORS       = Gauge('car_spectators_connected', 'Connected spectator clients')
+ADMIN_CONNECTED  = Gauge('car_admin_connected', 'Whether the admin is connected')
+ADMIN_COMMANDS   = Counter('car_admin_commands_total', 'PWM commands received from the admin')
+CONTROL_DROPPED  = Counter('car_control_dropped_total', 'UDP control datagrams not applied', ['reason'])
+AUTH_SECONDS     = Summary('car_auth_seconds', 'Time from accept to successful authentication, including key exchange')
+AUTH_FAILURES    = Counter('car_auth_failures_total', 'Connections that failed key exchange or authentication')
+PWM_THREAD_ALIVE = Gauge('car_pwm_thread_alive', 'Whether a software PWM thread is running', ['motor'])
+MOTOR_UPDATES    = Counter('car_motor_updates_total', 'Motor updates applied by the arbiter')
+WATCHDOG_TRIPS   = Counter('car_watchdog_trips_total', 'Motor stops triggered by the command watchdog')
+STARTUP_SECONDS  = Gauge('car_startup_phase_seconds', 'Duration of each server startup phase', ['phase'])
+SERVER_READY     = Gauge('car_server_ready', 'Whether camera, GPIO and database are initialised')
+STATIC_SCENE     = Gauge('car_static_scene', 'Whether the last frame was unchanged from the last one sent')
+DETECT_SECONDS   = Summary('car_change_detect_seconds', 'Scene change detection time per frame')
+ENCODES_SKIPPED  = Counter('car_encodes_skipped_total', 'JPEG encodes skipped because nobody needed a new frame')
+SENDS_SUPPRESSED = Counter('car_sends_suppressed_total', 'Spectator frame sends avoided in static scenes')
+KEEPALIVES_SENT  = Counter('car_keepalives_sent_total', 'Empty keep-alive datagrams sent instead of frames')
+BYTES_SAVED      = Counter('car_suppressed_bytes_saved_total', 'Estimated UDP bytes saved by static-scene suppression')
+LAYER_CLIENTS    = Gauge('car_layer_clients', 'Clients subscribed to each simulcast layer', ['layer'])
+LAYER_BYTES      = Summary('car_layer_frame_bytes', 'Encoded frame size per simulcast layer', ['layer'])
+HISTORY_FRAMES   = Gauge('car_history_frames', 'Encoded frames held for instant join and replay')
+HISTORY_SECONDS  = Gauge('car_history_seconds', 'Capture time covered by the recent-frame history')
+REPLAYS          = Counter('car_replays_total', 'Replays requested by clients')
+ENCODE_DROPPED   = Counter('car_encode_dropped_total', 'Frames dropped because encoding fell behind capture')
+ENCODE_BACKLOG   = Gauge('car_encode_backlog', 'Frames being encoded or waiting for their turn to be sent')
+CPU_SAVED        = Counter('car_suppressed_cpu_seconds_total', 'Estimated encode and send CPU seconds saved by suppression')
+
+def _create_camera():
+    if fake_hw_enabled():
+        return FakeCamera()
+    from picamera2 import Picamera2
+    return Picamera2()
 
 class CarController:
+    """
+    Camera and motors of the car. Hardware is brought up by init_motors()
+    and init_camera(), which the server runs concurrently at startup.
+    """
+
     def __init__(self):
+        self.motor = None
+        self.arbiter = None
+        self.picam2 = None
+
+    def init_motors(self):
         self.motor = MotorController()
-        self.picam2 = Picamera2()
-        cfg = self.picam2.create_preview_configuration(main={"size": (480, 270)})
-        self.picam2.configure(cfg)
-        self.picam2.start()
-        time.sleep(2)
+        arbiter = MotorArbiter(self.motor)
+        arbiter.start()
+        self.arbiter = arbiter
+
+    def init_camera(self, timeout=CAMERA_READY_TIMEOUT):
+        picam2 = _create_camera()
+        cfg = picam2.create_preview_configuration(main={"size": CAMERA_SIZE})
+        picam2.configure(cfg)
+        picam2.start()
+        self.picam2 = picam2
+        self._wait_camera_ready(timeout)
+
+    def _wait_camera_ready(self, timeout):
+        """Poll frames until the sensor delivers a non-black image, instead of a fixed sleep."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            frame = self.picam2.capture_array()
+            if frame is not None and frame.size and frame.max() > 0:
+                return
+            time.sleep(0.05)
+        print(f"[WARNING] Camera still dark after {timeout:.1f}s, continuing")
 
     def capture_frame(self):
         frame = self.picam2.capture_array()
@@ -28,26 +142,23 @@ class CarController:
         return cv2.rotate(frame, cv2.ROTATE_180)
 
     def process_pwm(self, pwm):
-        left  = pwm.get('left_duty',  0.0)
-        right = pwm.get('right_duty', 0.0)
-        lf    = pwm.get('left_freq', 50)
-        rf    = pwm.get('right_freq',50)
+        if self.arbiter is not None:
+            self.arbiter.submit(pwm)
 
-        if left == 0.0 and right == 0.0:
-            self.motor.stop()
-            print("[ADMIN] Motors stopped")
-        else:
-            self.motor.move_forward(
-                left_duty=left, right_duty=right,
-                left_freq=lf, right_freq=rf
-            )
-            print(f"[ADMIN] Ld:{left:.3f} Rd:{right:.3f}")
+    def halt(self):
+        if self.arbiter is not None:
+            self.arbiter.halt()
 
     def cleanup(self):
-        self.motor.stop()
-        self.motor.cleanup()
-        self.picam2.stop()
-        self.picam2.close()
+        if self.arbiter is not None:
+            self.arbiter.stop()
+            self.arbiter.join()
+        if self.motor is not None:
+            self.motor.stop()
+            self.motor.cleanup()
+        if self.picam2 is not None:
+            self.picam2.stop()
+            self.picam2.close()
 
 class CarRemoteServerApp:
     def __init__(self, host, port):
@@ -55,20 +166,111 @@ class CarRemoteServerApp:
         self.listen_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         self.listen_sock.bind((host, port))
         self.listen_sock.listen(MAX_CLIENTS)
-        print(f"Listening on {host}:{port} (1 admin + {MAX_CLIENTS-1} spectators)")
+        print(f"Listening on {host}:{port} ({CLASS_POLICIES['admin']['limit']} admin + "
+              f"{CLASS_POLICIES['spectator']['limit']} spectators)")
         # Create UDP socket for broadcasting frames
         self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        # UDP socket for admin PWM commands, on the port after the TCP one
+        self.control_socket = None
+        if UDP_CONTROL:
+            self.control_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.control_socket.bind((host, port + 1))
+        self.control_receiver = None     # ControlReceiver for the current admin session
 
         self.car            = CarController()
-        self.frame_period   = 1.0 / FRAME_RATE
+        self.rsa_keys       = RSAKeyPool()
+        self.ready          = threading.Event()
+        self.startup        = StartupSequence()
+        self.startup.add('gpio', self.car.init_motors)
+        self.startup.add('camera', self.car.init_camera)
+        self.startup.add('database', lambda: UserDB().close())
+        self.scheduler      = FrameScheduler(FRAME_RATE, skip_policy='skip')
         self.lock           = threading.Lock()
         self.clients        = []         # list of Protocol objects; each may have .udp_addr
         self.admin_protocol = None       # the one admin socket
+        self.spectators     = set()      # authenticated spectator Protocols
+        self._rr            = 0          # rotates which spectator is served first
+        self._frame_id      = 0
+        self._frame_info    = None       # (frame id, capture time) of the frame being sent
+        self._layer_bytes   = {}         # last encoded datagram size per simulcast layer
+        self.history        = RecentFrames(HISTORY_BYTES)
+        self.profiler       = SamplingProfiler()  # started and stopped by the admin
+        self.detector       = ChangeDetector(CHANGE_THRESHOLD) if CHANGE_THRESHOLD is not None else None
+        self.savings        = IdleSavings()
+        self.encoder        = None
+        if ENCODE_WORKERS:
+            self.encoder = ParallelEncoder(self._encode_layers, self._on_encoded, ENCODE_WORKERS, ENCODE_DEPTH)
         self.running        = True
+        self._register_metrics()
+
+    def _register_metrics(self):
+        car = self.car
+        PWM_THREAD_ALIVE.labels('right').set_function(
+            lambda: car.motor is not None and car.motor.ena_pwm.is_alive())
+        PWM_THREAD_ALIVE.labels('left').set_function(
+            lambda: car.motor is not None and car.motor.enb_pwm.is_alive())
+        MOTOR_UPDATES.set_function(lambda: car.arbiter.motor_updates if car.arbiter else 0)
+        WATCHDOG_TRIPS.set_function(lambda: car.arbiter.watchdog_trips if car.arbiter else 0)
+        SERVER_READY.set_function(self.ready.is_set)
+        FRAMES_SKIPPED.set_function(lambda: self.scheduler.skipped)
+        SPECTATORS.set_function(
+            lambda: sum(1 for prot in list(self.clients) if prot is not self.admin_protocol))
+        ADMIN_CONNECTED.set_function(lambda: self.admin_protocol is not None)
+        savings = self.savings
+        ENCODES_SKIPPED.set_function(lambda: savings.encodes_skipped)
+        SENDS_SUPPRESSED.set_function(lambda: savings.sends_suppressed)
+        KEEPALIVES_SENT.set_function(lambda: savings.keepalives)
+        BYTES_SAVED.set_function(lambda: savings.bytes_saved)
+        CPU_SAVED.set_function(lambda: savings.cpu_seconds_saved)
+        HISTORY_FRAMES.set_function(lambda: self.history.stats()["frames"])
+        HISTORY_SECONDS.set_function(lambda: self.history.stats()["seconds"])
+        for layer in simulcast.LAYER_NAMES:
+            LAYER_CLIENTS.labels(layer).set_function(
+                lambda layer=layer: sum(1 for prot in list(self.clients) if getattr(prot, "layer", None) == layer))
+        if self.encoder is not None:
+            encoder = self.encoder
+            ENCODE_DROPPED.set_function(lambda: encoder.dropped)
+            ENCODE_BACKLOG.set_function(encoder.backlog)
+
+    def _warm_up(self):
+        """Wait for the concurrent startup phases, then tell connected clients we are ready."""
+        ok = self.startup.wait_all()
+        print(self.startup.report())
+        for phase, seconds in self.startup.durations.items():
+            STARTUP_SECONDS.labels(phase).set(seconds)
+        if not ok:
+            print("[ERROR] Startup failed, car will not drive or stream")
+            return
+        self.ready.set()
+        with self.lock:
+            targets = list(self.clients)
+        for prot in targets:
+            self._send_status(prot)
+
+    def _send_status(self, protocol):
+        state = "ready" if self.ready.is_set() else "warming_up"
+        try:
+            protocol.send_json({"type": Protocol.CMDS['STATUS'], "state": state})
+        except OSError:
+            pass
 
     def run(self):
+        self.startup.start()
+        self.rsa_keys.start()  # handshakes only; not part of the readiness gate
+        threading.Thread(target=self._warm_up, daemon=True).start()
+
+        try:
+            start_metrics_server(METRICS_HOST, METRICS_PORT)
+            print(f"Metrics on http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+        except OSError as e:
+            print(f"[WARNING] Metrics endpoint disabled: {e}")
+
         # Start broadcasting frames to all clients
+        if self.encoder is not None:
+            self.encoder.start()
         threading.Thread(target=self._send_frames, daemon=True).start()
+        if self.control_socket is not None:
+            threading.Thread(target=self._receive_control, daemon=True).start()
 
         try:
             while self.running:
@@ -83,27 +285,42 @@ class CarRemoteServerApp:
             print("Shutting down server")
         finally:
             self.running = False
+            if self.encoder is not None:
+                self.encoder.stop()
             self.car.cleanup()
             self.listen_sock.close()
 
     def _handle_client(self, sock, addr):
+        t_accept = time.perf_counter()
         protocol = Protocol('server', None, None, listen_sock=self.listen_sock)
         protocol.conn = sock
 
         # Perform the encryption key exchange
         try:
-            protocol.key_exchange()
+            protocol.key_exchange(self.rsa_keys.get())
         except ConnectionClosedError:
+            AUTH_FAILURES.inc()
             return
 
+        self.startup.wait('database')
         db = UserDB()
         try:
             auth = False
             is_admin = False
             while not auth:
                 req = protocol.recv_json()
+                if not isinstance(req, dict):
+                    protocol.send_json({"status":"error","message":"Invalid request"})
+                    continue
                 u, p, t = req.get('username'), req.get('password'), req.get('type')
 
+                if u != ADMIN_USER and t in (Protocol.CMDS['SIGNUP'], Protocol.CMDS['LOGIN']):
+                    with self.lock:
+                        full = len(self.spectators) >= CLASS_POLICIES['spectator']['limit']
+                    if full:
+                        protocol.send_json({"status":"error","message":"Spectator limit reached"})
+                        raise ConnectionClosedError()
+
                 if t == Protocol.CMDS['SIGNUP']:
                     if u == ADMIN_USER:
                         protocol.send_json({"status":"error","message":"Cannot signup as admin"})
@@ -120,7 +337,12 @@ class CarRemoteServerApp:
                                     self.admin_protocol = protocol
                                     is_admin = True
                                     auth = True
-                                    protocol.send_json({"status":"success"})
+                                    reply = {"status":"success"}
+                                    if self.control_socket is not None:
+                                        protocol.admin_addr = addr[0]
+                                        self.control_receiver = ControlReceiver(protocol.crypto)
+                                        reply["control_port"] = self.control_socket.getsockname()[1]
+                                    protocol.send_json(reply)
                                 else:
                                     protocol.send_json({"status":"error","message":"Admin already connected"})
                                     raise ConnectionClosedError()
@@ -135,11 +357,17 @@ class CarRemoteServerApp:
                     protocol.send_json({"status":"error","message":"Invalid request"})
         except ConnectionClosedError:
             print(f"Auth failed for {addr}")
+            AUTH_FAILURES.inc()
             protocol.close()
             return
         finally:
             db.close()
 
+        AUTH_SECONDS.observe(time.perf_counter() - t_accept)
+        protocol.priority = 'admin' if is_admin else 'spectator'
+        if not is_admin:
+            with self.lock:
+                self.spectators.add(protocol)
         print(("ADMIN" if is_admin else "SPECTATOR"), f"{addr} authenticated")
 
         # Expect UDP port registration from client
@@ -147,63 +375,374 @@ class CarRemoteServerApp:
             udp_msg = protocol.recv_json()
             if udp_msg.get("type") == Protocol.CMDS['UDP_PORT']:
                 protocol.udp_addr = (addr[0], udp_msg.get("port"))
+                protocol.layer = simulcast.FULL
+                self._set_viewport(protocol, udp_msg.get("viewport"))
+                protocol.send_queue = ClientSendQueue(CLASS_POLICIES[protocol.priority]['queue'])
+                self._register_client_metrics(protocol)
         except Exception:
             protocol.close()
+            with self.lock:
+                self.spectators.discard(protocol)
+                if protocol is self.admin_protocol:
+                    self.admin_protocol = None
             return
+        self._send_latest(protocol)
 
-        if is_admin:
-            # Admin reads commands over TCP
-            try:
-                with self.lock:
-                    self.clients.append(protocol)
-                while self.running:
-                    cmd = protocol.recv_json()
+        with self.lock:
+            self.clients.append(protocol)
+        try:
+            self._send_status(protocol)
+            # Admin and spectators read requests over TCP; only the admin drives
+            while self.running:
+                cmd = protocol.recv_json()
+                if is_admin and isinstance(cmd, dict) and cmd.get("type") == Protocol.CMDS['PWM']:
+                    ADMIN_COMMANDS.inc()
                     self.car.process_pwm(cmd)
-            except ConnectionClosedError:
-                pass
-            finally:
+                else:
+                    self._handle_request(protocol, cmd)
+        except (ConnectionClosedError, OSError, ValueError):
+            pass
+        finally:
+            # Whatever ended the session, free the client's slot and stop sending to it
+            if is_admin:
                 print("Admin disconnected, stopping car")
-                self.car.motor.stop()
-        else:
+                self.car.halt()
+            self._set_video_mode(protocol, 'udp')
+            protocol.close()
             with self.lock:
-                self.clients.append(protocol)
+                if protocol in self.clients:
+                    self.clients.remove(protocol)
+                self.spectators.discard(protocol)
+                if protocol is self.admin_protocol:
+                    self.admin_protocol = None
+                    self.control_receiver = None
+            self._remove_client_metrics(protocol)
+            print(("ADMIN" if is_admin else "SPECTATOR"), f"{addr} disconnected")
+
+    def _handle_request(self, protocol, msg):
+        """Requests any client may send after registration."""
+        if not isinstance(msg, dict):
+            print(f"[WARNING] Ignoring malformed request from {getattr(protocol, 'udp_addr', None)}")
+            return
+        if msg.get("type") == Protocol.CMDS['VIDEO_MODE']:
+            mode = msg.get("mode")
+            if mode in ('udp', 'tcp'):
+                self._set_video_mode(protocol, mode)
+                print(f"[INFO] {protocol.udp_addr} switched to {mode} video")
+        elif msg.get("type") == Protocol.CMDS['VIEWPORT']:
+            self._set_viewport(protocol, (msg.get("width"), msg.get("height")))
+        elif msg.get("type") == Protocol.CMDS['REPLAY']:
+            self._start_replay(protocol, msg.get("seconds", 5.0), msg.get("speed", 1.0))
+        elif msg.get("type") == Protocol.CMDS['PROFILE'] and protocol is self.admin_protocol:
+            self._profile(protocol, msg.get("action"), msg.get("rate"))
+
+    def _profile(self, protocol, action, rate=None):
+        """Start or stop the sampling profiler; stopping sends the collapsed stacks back."""
+        reply = {"type": Protocol.CMDS['PROFILE']}
+        if action == "start":
             try:
-                while self.running:
-                    time.sleep(1)
-            except:
-                pass
+                self.profiler.start(None if rate is None else int(rate))
+            except (TypeError, ValueError) as e:
+                print(f"[WARNING] Bad profile request: {e}")
+                protocol.send_json({"type": Protocol.CMDS['PROFILE'], "status": "rejected", "message": str(e)})
+                return
+            reply.update(status="started", rate=self.profiler.rate)
+            print(f"[INFO] Profiling at {self.profiler.rate} Hz")
+        elif action == "stop":
+            if not self.profiler.running:
+                reply["status"] = "not_running"
+            else:
+                collapsed = self.profiler.stop()
+                stats = self.profiler.stats()
+                reply.update(status="stopped", stats=stats, collapsed=collapsed)
+                print(f"[INFO] Profile: {stats['samples']} samples at {stats['rate']:.0f} Hz, "
+                      f"{stats['sample_ms']:.3f} ms per sample, {stats['overhead']:.2%} of a core")
+        else:
+            return
+        protocol.send_json(reply)
 
-        protocol.close()
-        with self.lock:
-            if protocol in self.clients:
-                self.clients.remove(protocol)
-            if protocol is self.admin_protocol:
-                self.admin_protocol = None
-        print(("ADMIN" if is_admin else "SPECTATOR"), f"{addr} disconnected")
+    def _send_recorded(self, protocol, frame):
+        """Send a frame from the history outside the live broadcast, marked as recorded."""
+        tcp_video = getattr(protocol, "tcp_video", None)
+        if tcp_video is not None:
+            tcp_video.put(frame.payload, frame.frame_id, frame.timestamp, frame.shape, recorded=True)
+        else:
+            self._send_to(protocol, Protocol.mark_recorded(frame.payload))
+
+    def _send_latest(self, protocol):
+        """Show a newly registered client the last frame now rather than at the next capture."""
+        frame = self.history.latest()
+        if frame is None or not hasattr(protocol, "udp_addr"):
+            return
+        try:
+            self._send_recorded(protocol, frame)
+        except OSError:
+            pass
+
+    def _start_replay(self, protocol, seconds, speed):
+        try:
+            seconds, speed = float(seconds), min(max(float(speed), 0.1), REPLAY_MAX_SPEED)
+        except (TypeError, ValueError):
+            return
+        frames = self.history.window(seconds)
+        if getattr(protocol, "replaying", False) or len(frames) < 2:
+            protocol.send_json({"type": Protocol.CMDS['REPLAY'], "status": "unavailable"})
+            return
+        REPLAYS.inc()
+        protocol.replaying = True
+        if protocol is self.admin_protocol:
+            self.car.halt()  # the admin's client does not drive while it watches the past
+        protocol.send_json({"type": Protocol.CMDS['REPLAY'], "status": "started", "frames": len(frames),
+                            "seconds": frames[-1][1] - frames[0][1], "speed": speed})
+        threading.Thread(target=self._replay, args=(protocol, frames, speed), daemon=True).start()
+
+    def _replay(self, protocol, frames, speed):
+        """Resend recorded frames at their original pacing scaled by speed; live frames pause meanwhile."""
+        t_start = time.monotonic()
+        first = frames[0][1]
+        try:
+            for frame_id, timestamp in frames:
+                if not self.running:
+                    break
+                delay = t_start + (timestamp - first) / speed - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                frame = self.history.get(frame_id)
+                if frame is None:
+                    continue  # evicted while replaying
+                try:
+                    self._send_recorded(protocol, frame)
+                except BlockingIOError:
+                    pass
+            protocol.send_json({"type": Protocol.CMDS['REPLAY'], "status": "done"})
+        except OSError:
+            pass
+        finally:
+            protocol.replaying = False
+
+    def _set_viewport(self, protocol, viewport):
+        """Subscribe a spectator to the smallest layer filling its viewport; the admin stays on full."""
+        if protocol.priority == 'admin' or not viewport:
+            return
+        try:
+            width, height = (int(v) for v in viewport)
+        except (TypeError, ValueError, OverflowError):  # e.g. JSON 1e999
+            return
+        if width <= 0 or height <= 0:
+            return
+        layer = simulcast.select_layer((width, height), CAMERA_SIZE)
+        if layer != protocol.layer:
+            print(f"[INFO] {protocol.udp_addr} viewport {width}x{height}, now on the {layer} layer")
+            protocol.layer = layer
+
+    def _set_video_mode(self, protocol, mode):
+        sender = getattr(protocol, "tcp_video", None)
+        if mode == 'tcp' and sender is None:
+            protocol.tcp_video = LatestFrameSender(protocol, protocol.send_queue, protocol.bytes_counter.inc)
+            protocol.tcp_video.start()
+        elif mode == 'udp' and sender is not None:
+            sender.stop()
+            protocol.tcp_video = None
+
+    def _receive_control(self):
+        """Apply the newest fresh PWM command from the admin's UDP control datagrams."""
+        while self.running:
+            try:
+                data, src = self.control_socket.recvfrom(2048)
+            except OSError:
+                break
+            with self.lock:
+                admin, receiver = self.admin_protocol, self.control_receiver
+            if admin is None or receiver is None or src[0] != getattr(admin, "admin_addr", None):
+                CONTROL_DROPPED.labels('unknown_sender').inc()
+                continue
+            cmd = receiver.open(data)
+            if cmd is None:
+                CONTROL_DROPPED.labels(receiver.last_drop_reason).inc()
+                continue
+            if cmd.get("type") == Protocol.CMDS['PWM']:
+                ADMIN_COMMANDS.inc()
+                self.car.process_pwm(cmd)
+
+    def _register_client_metrics(self, protocol):
+        label = f"{protocol.udp_addr[0]}:{protocol.udp_addr[1]}"
+        protocol.metrics_label = label
+        protocol.bytes_counter = CLIENT_BYTES.labels(label)
+        queue = protocol.send_queue
+        CLIENT_DROPS.labels(label).set_function(lambda: queue.dropped)
+        CLIENT_PUSHBACK.labels(label).set_function(lambda: queue.backpressure)
+        CLIENT_SKIPPED.labels(label).set_function(lambda: queue.skipped)
+
+    def _remove_client_metrics(self, protocol):
+        label = getattr(protocol, "metrics_label", None)
+        if label is not None:
+            for metric in (CLIENT_BYTES, CLIENT_DROPS, CLIENT_PUSHBACK, CLIENT_SKIPPED):
+                metric.remove(label)
+
+    def _send_to(self, prot, payload):
+        sent = prot.send_encoded_frame_udp(payload, prot.udp_addr, self.udp_socket)
+        ENCRYPT_SECONDS.observe(prot.frame_sender.last_encrypt_seconds)
+        SEND_SECONDS.observe(prot.frame_sender.last_send_seconds)
+        prot.bytes_counter.inc(sent)
+        prot.last_datagram = time.monotonic()
+        if len(payload):
+            prot.last_full_frame = prot.last_datagram
+            self.savings.observe_send(prot.frame_sender.last_encrypt_seconds + prot.frame_sender.last_send_seconds)
 
     def _send_frames(self):
         self.udp_socket.setblocking(False)  # avoid blocking on slow clients
+        last_report = time.monotonic()
+        last_capture = None
+        fps = 0.0
+        self.ready.wait()
         while self.running:
-            t0 = time.time()
+            self.scheduler.wait()
+            t0 = time.perf_counter()
             frame = self.car.capture_frame()
+            t1 = time.perf_counter()
+            CAPTURE_SECONDS.observe(t1 - t0)
+            FRAMES_CAPTURED.inc()
+            if last_capture is not None and t0 > last_capture:
+                fps = 0.9 * fps + 0.1 / (t0 - last_capture)
+                CAPTURE_FPS.set(fps)
+            last_capture = t0
+
             with self.lock:
                 targets = [prot for prot in self.clients if hasattr(prot, "udp_addr")]
+            if not targets:
+                continue
 
-            for prot in targets:
-                try:
-                    # Use Protocol method to send encrypted frame over UDP
-                    prot.send_frame_udp(frame, prot.udp_addr, self.udp_socket)
-                except (BlockingIOError, OSError):
-                    print(f"[WARNING] Dropping frame for {prot.udp_addr}")
-                except Exception as e:
-                    print(f"[ERROR] Failed to send frame to {prot.udp_addr}: {e}")
-                    with self.lock:
-                        if prot in self.clients:
-                            self.clients.remove(prot)
+            full, idle = self._split_static(frame, targets, t1)
+            if full:
+                self._frame_id += 1
+                meta = (full, t0, (self._frame_id, time.time() - (time.perf_counter() - t0)))
+                job = (frame, {prot.layer for prot in full})
+                if self.encoder is not None:
+                    self.encoder.submit(job, meta)
+                else:
+                    t_encode = time.perf_counter()
+                    layers = self._encode_layers(job)
+                    self._on_encoded(layers, meta, time.perf_counter() - t_encode)
+            else:
+                self.savings.skip_encode()
+            if idle:
+                self._keep_alive(idle)
+
+            if time.monotonic() - last_report >= STATS_INTERVAL:
+                last_report = time.monotonic()
+                self._report_frame_stats(targets)
+
+    @staticmethod
+    def _encode_layers(job):
+        frame, names = job
+        return simulcast.encode_layers(frame, names)
+
+    def _on_encoded(self, layers, meta, encode_seconds):
+        """Send one encoded frame; called in capture order, from the encoder's emitter thread if enabled."""
+        targets, t_capture, self._frame_info = meta
+        ENCODE_SECONDS.observe(encode_seconds)
+        largest = next(name for name in simulcast.LAYER_NAMES if name in layers)
+        self.history.add(layers[largest][0], *self._frame_info, layers[largest][1], largest)
+        for name, (payload, _) in layers.items():
+            self._layer_bytes[name] = len(payload) + KEEPALIVE_BYTES
+            LAYER_BYTES.labels(name).observe(len(payload))
+        self.savings.observe_encode(encode_seconds, max(self._layer_bytes[name] for name in layers))
+        # Encode each layer once; each client only encrypts and sends the shared payload
+        self._broadcast(layers, targets, t_capture, time.perf_counter())
+
+    def _split_static(self, frame, targets, t_captured):
+        """
+        Split targets into clients that get this frame and spectators that
+        are suppressed because the scene has not changed since the last one.
+        """
+        if self.detector is None:
+            return targets, []
+        changed = self.detector.changed(frame)
+        DETECT_SECONDS.observe(time.perf_counter() - t_captured)
+        STATIC_SCENE.set(0.0 if changed else 1.0)
+        if changed:
+            return targets, []
+        now = time.monotonic()
+        full, idle = [], []
+        for prot in targets:
+            if prot.priority == 'admin' or now - getattr(prot, 'last_full_frame', 0.0) >= STATIC_REFRESH:
+                full.append(prot)
+            else:
+                idle.append(prot)
+        return full, idle
+
+    def _keep_alive(self, idle):
+        """Send suppressed spectators an empty datagram now and then so they know the car is alive."""
+        now = time.monotonic()
+        for prot in idle:
+            frame_bytes = self._layer_bytes.get(prot.layer)
+            if len(prot.send_queue) or now - getattr(prot, 'last_datagram', 0.0) < KEEPALIVE_INTERVAL:
+                self.savings.suppress(0, frame_bytes)
+                continue
+            self.savings.suppress(KEEPALIVE_BYTES, frame_bytes)
+            self._deliver(prot, KEEPALIVE)
+
+    def _broadcast(self, layers, targets, t_capture, t_encoded):
+        """
+        Serve the priority classes in CLASS_POLICIES order. Within a class the
+        starting client rotates each frame so budget skips are shared fairly.
+        """
+        spectators = sum(1 for prot in targets if prot.priority == 'spectator')
+        self._rr += 1
+        for cls, policy in CLASS_POLICIES.items():
+            members = [prot for prot in targets if prot.priority == cls]
+            if not members:
+                continue
+            start = self._rr % len(members)
+            members = members[start:] + members[:start]
+            deadline = None
+            if policy['budget'] is not None:
+                deadline = t_capture + policy['budget'] * self.scheduler.period
+            for prot in members:
+                if deadline is not None and time.perf_counter() > deadline:
+                    prot.send_queue.skip()
+                    continue
+                self._deliver(prot, *layers[prot.layer])
+                if cls == 'admin':
+                    ADMIN_SEND_SECONDS.labels(spectators).observe(time.perf_counter() - t_encoded)
+
+    def _deliver(self, prot, payload, shape=None):
+        if getattr(prot, "replaying", False):
+            return
+        tcp_video = getattr(prot, "tcp_video", None)
+        if tcp_video is not None:
+            if len(payload):   # TCP needs no keep-alives
+                tcp_video.put(payload, *self._frame_info, shape)
+            return
+        prot.send_queue.put(payload)
+        try:
+            prot.send_queue.flush(lambda p: self._send_to(prot, p))
+        except OSError:
+            print(f"[WARNING] Dropping frame for {prot.udp_addr}")
+        except Exception as e:
+            # The frame is dropped, not the client; disconnects are noticed on its TCP connection
+            print(f"[ERROR] Failed to send frame to {prot.udp_addr}: {e}")
 
-            dt = time.time() - t0
-            if dt < self.frame_period:
-                time.sleep(self.frame_period - dt)
+    def _report_frame_stats(self, targets):
+        s = self.scheduler.lateness_stats()
+        if s["count"]:
+            print(f"[STATS] ticks:{s['ticks']} skipped:{s['skipped']} "
+                  f"late p50:{s['p50']*1000:.1f}ms p99:{s['p99']*1000:.1f}ms max:{s['max']*1000:.1f}ms")
+        for prot in targets:
+            q = prot.send_queue.stats()
+            mode = "tcp" if getattr(prot, "tcp_video", None) is not None else "udp"
+            print(f"[STATS] {prot.priority} {prot.udp_addr} {mode} sent:{q['sent']} dropped:{q['dropped']} "
+                  f"skipped:{q['skipped']} backpressure:{q['backpressure']}")
+        if self.encoder is not None:
+            e = self.encoder.stats()
+            print(f"[STATS] encoder x{self.encoder.workers}: emitted:{e['emitted']} dropped:{e['dropped']} "
+                  f"errors:{e['errors']} backlog:{e['backlog']}")
+        if self.detector is not None:
+            print(f"[STATS] static scene: {self.savings.summary()}")
+        for spectators, summary in sorted(ADMIN_SEND_SECONDS.children()):
+            if summary.count:
+                print(f"[STATS] admin send latency with {spectators[0]} spectators: "
+                      f"{summary.sum / summary.count * 1000:.2f} ms avg over {summary.count} frames")
 
 if __name__ == "__main__":
     app = CarRemoteServerApp('0.0.0.0', 8000)
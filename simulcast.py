@@ -0,0 +1,90 @@
+# Simulcast resolution layers.
+# Each captured frame can be encoded at a few sizes; every client is
+# subscribed to the smallest layer that still fills its viewport, so a
+# spectator with a small window neither downloads nor decodes pixels it
+# would only scale away.
+
+import cv2
+
+# name, scale of the captured frame, JPEG quality; largest first
+LAYERS = (
+    ('full',    1.0,  95),   # same as the single-stream encode; the admin's lane detection reads it
+    ('half',    0.5,  85),
+    ('quarter', 0.25, 80),
+)
+LAYER_NAMES = tuple(layer[0] for layer in LAYERS)
+FULL = LAYER_NAMES[0]
+
+def layer_size(name, frame_size):
+    """(width, height) of a layer for a captured frame of frame_size (width, height)."""
+    scale = next(layer[1] for layer in LAYERS if layer[0] == name)
+    return max(1, round(frame_size[0] * scale)), max(1, round(frame_size[1] * scale))
+
+def select_layer(viewport, frame_size):
+    """
+    Smallest layer that fills a viewport (width, height) when shown with its
+    aspect ratio kept, as the GUIs do. Unknown viewports get the full layer.
+    """
+    if not viewport:
+        return FULL
+    fit = min(viewport[0] / frame_size[0], viewport[1] / frame_size[1])
+    needed_width = frame_size[0] * fit
+    for name in reversed(LAYER_NAMES):
+        if layer_size(name, frame_size)[0] >= needed_width:
+            return name
+    return FULL
+
+def encode_layers(frame, names):
+    """
+    Encode the requested layers of one frame to JPEG.
+    Returns {name: (payload memoryview, shape)}.
+    """
+    height, width = frame.shape[:2]
+    layers = {}
+    for name, scale, quality in LAYERS:
+        if name not in names:
+            continue
+        img = frame
+        if scale != 1.0:
+            img = cv2.resize(frame, layer_size(name, (width, height)), interpolation=cv2.INTER_AREA)
+        ret, encoded = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        if not ret:
+            raise ValueError(f"Failed to encode {name} layer to JPEG")
+        layers[name] = (memoryview(encoded.reshape(-1)), img.shape)
+    return layers
+
+def _compare(frame_size=(480, 270), viewports=((1200, 800), (640, 360), (320, 180), (160, 120)), repeats=50):
+    """
+    Per-client bytes and decode time of the selected layer against receiving
+    the full frame (single-layer streaming), for a few viewport sizes.
+    """
+    import time
+    import numpy as np
+
+    width, height = frame_size
+    rng = np.random.default_rng(0)
+    frame = cv2.resize(rng.integers(0, 255, (height // 6, width // 6, 3), dtype=np.uint8),
+                       frame_size, interpolation=cv2.INTER_CUBIC)
+    cv2.rectangle(frame, (width // 3, height // 2), (2 * width // 3, height), (40, 40, 40), -1)
+    layers = encode_layers(frame, LAYER_NAMES)
+
+    def decode_ms(payload):
+        buf = np.frombuffer(payload, np.uint8)
+        t0 = time.perf_counter()
+        for _ in range(repeats):
+            cv2.imdecode(buf, cv2.IMREAD_COLOR)
+        return (time.perf_counter() - t0) / repeats * 1000
+
+    full_bytes = len(layers[FULL][0])
+    full_ms = decode_ms(layers[FULL][0])
+    print(f"single layer: {full_bytes} bytes, decode {full_ms:.2f} ms")
+    for viewport in viewports:
+        name = select_layer(viewport, frame_size)
+        payload, shape = layers[name]
+        ms = decode_ms(payload)
+        print(f"viewport {viewport[0]:4d}x{viewport[1]:<4d} -> {name:7s} {shape[1]}x{shape[0]}: "
+              f"{len(payload):6d} bytes ({len(payload) / full_bytes:4.0%}), "
+              f"decode {ms:.2f} ms ({ms / full_ms:4.0%})")
+
+if __name__ == "__main__":
+    _compare()
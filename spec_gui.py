@@ -4,11 +4,17 @@ from PIL import Image, ImageTk
 import cv2
 import numpy as np
 
+VIEWPORT_DEBOUNCE_MS = 300  # wait for resizing to settle before telling the car
+REPLAY_SECONDS = 10.0
+REPLAY_SPEED = 0.5
+
 class SpectatorGUI(tk.Tk):
+    SIZE = (1200, 800)
+
     def __init__(self):
         super().__init__()
         self.title("Spectator View")
-        self.geometry("1200x800")
+        self.geometry(f"{self.SIZE[0]}x{self.SIZE[1]}")
         self.configure(bg="white")
 
         # Same StringVars as AdminGUI
@@ -16,6 +22,8 @@ class SpectatorGUI(tk.Tk):
         self.info   = tk.StringVar()
         self.control_flags = {}   # just for compatibility
         self.server = None        # filled in by client_main
+        self._reported_viewport = None
+        self._viewport_job = None
 
         # Dummy PID-graph so client.pid_graph.update(...) won’t crash
         self.pid_graph = type("Stub", (), {
@@ -30,17 +38,43 @@ class SpectatorGUI(tk.Tk):
 
         ttk.Label(top, textvariable=self.car_ip, font=("Helvetica",12)).pack(side=tk.LEFT, padx=5)
         ttk.Button(top, text="Close", command=self.destroy).pack(side=tk.RIGHT, padx=5)
+        ttk.Button(top, text=f"Replay {REPLAY_SECONDS:.0f} s", command=self.replay).pack(side=tk.RIGHT, padx=5)
 
         # Only one large label for the camera feed
         self.orig_lbl = tk.Label(self)
         self.orig_lbl.pack(expand=True, fill=tk.BOTH, padx=5, pady=5)
+        self.orig_lbl.bind("<Configure>", self._on_resize)
 
         bot = ttk.Frame(self)
         bot.pack(pady=5, fill=tk.X)
         tk.Label(bot, textvariable=self.info, font=("Helvetica",12), fg="blue").pack()
 
+    def viewport(self):
+        """Size of the video label, or the initial window size before it is shown."""
+        w, h = self.orig_lbl.winfo_width(), self.orig_lbl.winfo_height()
+        if w > 1 and h > 1:
+            return w, h
+        return self.SIZE
+
+    def _on_resize(self, event):
+        # Report the new size once resizing settles so the car can pick a stream layer
+        if self._viewport_job is not None:
+            self.after_cancel(self._viewport_job)
+        self._viewport_job = self.after(VIEWPORT_DEBOUNCE_MS, self._report_viewport)
+
+    def _report_viewport(self):
+        self._viewport_job = None
+        viewport = self.viewport()
+        if viewport != self._reported_viewport and hasattr(self.server, "send_viewport"):
+            self._reported_viewport = viewport
+            self.server.send_viewport(*viewport)
+
+    def replay(self):
+        if self.server is not None:
+            self.server.request_replay(REPLAY_SECONDS, REPLAY_SPEED)
+
     def resize_with_aspect_ratio(self, image, target_w, target_h):
-        aspect = 640 / 380
+        aspect = image.shape[1] / image.shape[0]  # layers differ in size, not in aspect
         if (target_w / target_h) > aspect:
             nh = target_h
             nw = int(nh * aspect)
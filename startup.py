@@ -0,0 +1,67 @@
+# Concurrent, timed startup phases for the car server.
+
+import threading
+import time
+
+class StartupSequence:
+    """
+    Runs named startup phases on their own threads and records how long each
+    took. Callers can wait for a single phase or for all of them.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._events = {}
+        self.durations = {}
+        self.errors = {}
+        self.started_at = time.monotonic()
+        self.finished_at = None
+        self._threads = []
+
+    def add(self, name, fn):
+        event = threading.Event()
+        with self._lock:
+            self._events[name] = event
+        thread = threading.Thread(target=self._run, args=(name, fn, event), daemon=True)
+        self._threads.append(thread)
+
+    def start(self):
+        self.started_at = time.monotonic()
+        for thread in self._threads:
+            thread.start()
+        threading.Thread(target=self._finish, daemon=True).start()
+
+    def _run(self, name, fn, event):
+        t0 = time.monotonic()
+        try:
+            fn()
+        except Exception as e:
+            self.errors[name] = e
+            print(f"[STARTUP] {name} failed: {e}")
+        finally:
+            self.durations[name] = time.monotonic() - t0
+            event.set()
+
+    def _finish(self):
+        for thread in self._threads:
+            thread.join()
+        self.finished_at = time.monotonic()
+
+    def wait(self, name, timeout=None):
+        """Block until the named phase has finished; True if it succeeded."""
+        self._events[name].wait(timeout)
+        return self._events[name].is_set() and name not in self.errors
+
+    def wait_all(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for name in list(self._events):
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if not self.wait(name, remaining):
+                return False
+        return True
+
+    def report(self):
+        total = (self.finished_at or time.monotonic()) - self.started_at
+        parts = ", ".join(f"{name} {self.durations[name]:.2f}s" for name in sorted(self.durations))
+        status = "ok" if not self.errors else f"failed: {', '.join(self.errors)}"
+        return f"[STARTUP] {total:.2f}s total ({parts}) {status}"
@@ -0,0 +1,261 @@
+# Reliable video over the session's TCP stream, for networks that block UDP.
+#
+# Frames share the encrypted TCP stream with the JSON messages, using the
+# same length (4) + sealed framing. The plaintext of a JSON message always
+# starts with '{'; a video frame starts with VIDEO_KIND and a fixed header:
+#
+#   kind (1) | frame id (4) | capture timestamp (8, time.time()) |
+#   height (2) | width (2) | channels (1) | codec (1) | flags (1) | payload
+#
+# FLAG_RECORDED marks frames resent from the car's history (join, replay);
+# clients must not drive on them.
+#
+# TCP never drops anything, so the sender keeps at most one frame pending
+# per client and replaces it when a newer one arrives (latest frame wins)
+# instead of letting old frames queue up in the socket.
+
+import collections
+import socket
+import struct
+import threading
+import time
+import numpy as np
+
+VIDEO_KIND   = b'V'
+VIDEO_HEADER = struct.Struct('<cIdHHBBB')
+CODEC_RAW    = 0
+CODEC_JPEG   = 1
+FLAG_RECORDED = 0x01
+CODECS       = {CODEC_RAW: 'raw', CODEC_JPEG: 'jpeg'}
+NOTSENT_LOWAT = 16 * 1024     # bytes of unsent data the kernel may hold per client
+TCP_NOTSENT_LOWAT = getattr(socket, 'TCP_NOTSENT_LOWAT', 25)   # Linux value
+
+VideoFrame = collections.namedtuple('VideoFrame', 'frame_id timestamp shape codec payload recorded')
+
+def pack_header(frame_id, timestamp, shape, codec=CODEC_JPEG, recorded=False):
+    height, width = shape[:2]
+    channels = shape[2] if len(shape) > 2 else 1
+    flags = FLAG_RECORDED if recorded else 0
+    return VIDEO_HEADER.pack(VIDEO_KIND, frame_id & 0xFFFFFFFF, timestamp, height, width, channels, codec, flags)
+
+def is_video(plaintext):
+    return plaintext[:1] == VIDEO_KIND
+
+def parse(plaintext):
+    """Split a decrypted video message into a VideoFrame."""
+    if len(plaintext) < VIDEO_HEADER.size:
+        raise ValueError("Truncated video frame header")
+    _, frame_id, timestamp, height, width, channels, codec, flags = VIDEO_HEADER.unpack_from(plaintext)
+    if codec not in CODECS:
+        raise ValueError(f"Unknown video codec: {codec}")
+    shape = (height, width, channels) if channels > 1 else (height, width)
+    return VideoFrame(frame_id, timestamp, shape, codec, memoryview(plaintext)[VIDEO_HEADER.size:],
+                      bool(flags & FLAG_RECORDED))
+
+def decode(video_frame):
+    """Decode a VideoFrame to an image and check it against the advertised shape."""
+    buf = np.frombuffer(video_frame.payload, np.uint8)
+    if video_frame.codec == CODEC_RAW:
+        return buf.reshape(video_frame.shape)
+    import cv2
+    frame = cv2.imdecode(buf, cv2.IMREAD_COLOR if len(video_frame.shape) > 2 else cv2.IMREAD_GRAYSCALE)
+    if frame is None:
+        raise ValueError("Failed to decode frame from JPEG")
+    if frame.shape != video_frame.shape:
+        raise ValueError(f"Frame shape {frame.shape} does not match header {video_frame.shape}")
+    return frame
+
+def limit_unsent(sock, lowat=NOTSENT_LOWAT):
+    """Keep little unsent data in the kernel so a stalled client does not hide seconds of video."""
+    try:
+        sock.setsockopt(socket.IPPROTO_TCP, TCP_NOTSENT_LOWAT, lowat)
+    except OSError:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4 * lowat)
+
+class LatestFrameSender(threading.Thread):
+    """
+    Per-client TCP video sender. put() never blocks: it replaces any frame
+    still waiting, and the thread sends whatever is newest once the previous
+    send has completed. sent and dropped counts go to `stats` (a
+    ClientSendQueue) so TCP clients show up in the same reports as UDP ones.
+    """
+
+    def __init__(self, protocol, stats, on_sent=None):
+        super().__init__(daemon=True)
+        self.protocol = protocol
+        self.stats = stats
+        self.on_sent = on_sent
+        self.error = None
+        self._pending = None
+        self._cond = threading.Condition()
+        self._running = True
+        limit_unsent(protocol.conn if protocol.role == 'server' else protocol.sock)
+
+    def put(self, payload, frame_id, timestamp, shape, codec=CODEC_JPEG, recorded=False):
+        with self._cond:
+            if self._pending is not None:
+                self.stats.dropped += 1
+            self._pending = (payload, frame_id, timestamp, shape, codec, recorded)
+            self._cond.notify()
+
+    def run(self):
+        while True:
+            with self._cond:
+                while self._running and self._pending is None:
+                    self._cond.wait()
+                if not self._running:
+                    return
+                item, self._pending = self._pending, None
+            try:
+                sent = self.protocol.send_video_frame(*item)
+            except OSError as e:
+                self.error = e
+                self.stats.errors += 1
+                return
+            self.stats.sent += 1
+            if self.on_sent is not None:
+                self.on_sent(sent)
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+
+def _percentiles(values):
+    if not values:
+        return "no frames"
+    values = sorted(values)
+    pick = lambda q: values[int(q * (len(values) - 1))] * 1000
+    return f"p50 {pick(0.5):6.1f} ms  p95 {pick(0.95):6.1f} ms  max {values[-1] * 1000:6.1f} ms"
+
+def _loopback_compare(seconds=10.0, rate=20.0, size=30000, loss=0.02, rto=0.2, seed=0):
+    """
+    Stream `size`-byte frames at `rate` over loopback via UDP and via TCP
+    video and print delivery and latency for each.
+
+    Loss is simulated by relays: the UDP relay drops a datagram with
+    probability `loss`; the TCP relay stalls the stream for `rto` seconds
+    with the same probability per frame-sized chunk, which is what a lost
+    segment costs TCP (head-of-line blocking until retransmission). For
+    real loss on Linux use `tc qdisc add dev lo root netem loss 2%` and
+    loss=0.
+    """
+    import random
+    from protocol import Protocol
+
+    rng = random.Random(seed)
+    frames = int(seconds * rate)
+
+    server = Protocol('server', '127.0.0.1', 0)
+    server_port = server.sock.getsockname()[1]
+    client = Protocol('client', '127.0.0.1', 0)
+
+    # TCP relay: client -> relay -> server, stalling server -> client traffic
+    relay_listen = socket.create_server(('127.0.0.1', 0))
+    client.port = relay_listen.getsockname()[1]
+
+    def pipe(src, dst, lossy):
+        chunk_bytes = 0
+        try:
+            while True:
+                data = src.recv(65536)
+                if not data:
+                    break
+                chunk_bytes += len(data)
+                while lossy and chunk_bytes >= size:
+                    chunk_bytes -= size
+                    if rng.random() < loss:
+                        time.sleep(rto)
+                dst.sendall(data)
+        except OSError:
+            pass
+
+    def relay():
+        down, _ = relay_listen.accept()
+        up = socket.create_connection(('127.0.0.1', server_port))
+        threading.Thread(target=pipe, args=(down, up, False), daemon=True).start()
+        pipe(up, down, True)
+
+    threading.Thread(target=relay, daemon=True).start()
+    accept = threading.Thread(target=lambda: (server.accept(), server.key_exchange()))
+    accept.start()
+    client.connect()
+    client.key_exchange()
+    accept.join()
+
+    # UDP: server -> lossy relay -> client
+    udp_out = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    udp_relay = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    udp_relay.bind(('127.0.0.1', 0))
+    udp_in = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    udp_in.bind(('127.0.0.1', 0))
+    udp_in.settimeout(1.0)
+
+    def udp_forward():
+        while True:
+            data, _ = udp_relay.recvfrom(65535)
+            if rng.random() >= loss:
+                udp_out.sendto(data, udp_in.getsockname())
+
+    threading.Thread(target=udp_forward, daemon=True).start()
+
+    payload = bytearray(np.random.default_rng(seed).integers(0, 255, size, dtype=np.uint8).tobytes())
+    stamp = struct.Struct('d')
+
+    def stream(send):
+        for i in range(frames):
+            send(i)
+            time.sleep(1.0 / rate)
+
+    # UDP run
+    udp_latency = []
+
+    def udp_receive():
+        while True:
+            try:
+                data = client.recv_jpeg_udp(udp_in)
+            except socket.timeout:
+                return
+            udp_latency.append(time.perf_counter() - stamp.unpack_from(data)[0])
+
+    receiver = threading.Thread(target=udp_receive)
+    receiver.start()
+
+    def udp_send(i):
+        stamp.pack_into(payload, 0, time.perf_counter())
+        server.send_encoded_frame_udp(payload, udp_relay.getsockname(), udp_out)
+
+    stream(udp_send)
+    receiver.join()
+
+    # TCP run
+    class _Stats:
+        sent = dropped = errors = 0
+    stats = _Stats()
+    sender = LatestFrameSender(server, stats)
+    sender.start()
+    tcp_latency = []
+
+    def tcp_receive():
+        while True:
+            msg = client.recv_message()
+            if isinstance(msg, VideoFrame):
+                tcp_latency.append(time.perf_counter() - msg.timestamp)
+                if msg.frame_id == frames - 1:
+                    return
+
+    receiver = threading.Thread(target=tcp_receive, daemon=True)
+    receiver.start()
+    stream(lambda i: sender.put(payload, i, time.perf_counter(), (size, 1), CODEC_RAW))
+    receiver.join(timeout=5.0)
+    sender.stop()
+
+    print(f"{frames} frames of {size} bytes at {rate:.0f} fps, {loss:.0%} simulated loss")
+    print(f"UDP: {len(udp_latency) / frames:6.1%} delivered  {_percentiles(udp_latency)}")
+    print(f"TCP: {len(tcp_latency) / frames:6.1%} delivered  {_percentiles(tcp_latency)}  "
+          f"({stats.dropped} replaced before sending)")
+    client.close()
+    server.close()
+
+if __name__ == "__main__":
+    _loopback_compare()